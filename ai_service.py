@@ -1,6 +1,8 @@
+import asyncio
 import logging
 import os
-from typing import AsyncGenerator, Optional
+import time
+from typing import AsyncGenerator, Dict, Optional, Tuple
 
 from gemini_service import GeminiService
 from sheets_gateway import AsyncGoogleSheetsGateway
@@ -8,6 +10,13 @@ from sheets_gateway import AsyncGoogleSheetsGateway
 logger = logging.getLogger(__name__)
 
 
+def _env_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    return raw.strip().lower() in ("1", "true", "yes", "y", "on")
+
+
 class AIService:
     """Facade for the active chat backend."""
 
@@ -25,14 +34,58 @@ class AIService:
 
         # Backward compatibility for legacy call sites.
         self.gemini_service = self.service
+
+        # Hedged requests: если основной вызов не ответил за hedge_delay,
+        # параллельно запускаем дублирующий и берём первый успешный ответ.
+        self.hedging_enabled = _env_bool("AI_HEDGE_ENABLED", False)
+        self.hedge_delay = int(os.getenv("AI_HEDGE_DELAY_MS", "15000") or 15000) / 1000
+        self.max_hedges = max(0, int(os.getenv("AI_MAX_HEDGES", "1") or 1))
+        # Бэкенд пишет историю диалога при успешном ask(), и дубли записали бы
+        # её дважды: хеджируем только бэкенды, где запись истории можно
+        # отложить и сделать один раз для победителя (record_exchange).
+        if self.hedging_enabled and not hasattr(self.service, "record_exchange"):
+            logger.warning("AI_HEDGE_ENABLED игнорируется: бэкенд %s не поддерживает record_exchange", self.backend_name)
+            self.hedging_enabled = False
+
+        # Coalescing: одинаковые запросы (повторы, двойные нажатия) ждут один
+        # и тот же upstream-вызов; результат держится ещё inflight_ttl секунд.
+        self._inflight: Dict[Tuple[int, str, str, str], asyncio.Future] = {}
+        self.inflight_ttl = float(os.getenv("AI_COALESCE_TTL_SEC", "2") or 2)
+
+        # Батчинг стрима: мелкие токены склеиваются в один чанк, пока не
+        # наберётся stream_batch_chars символов или не пройдёт stream_batch_ms.
+        self.stream_batch_chars = int(os.getenv("AI_STREAM_BATCH_CHARS", "256") or 256)
+        self.stream_batch_ms = int(os.getenv("AI_STREAM_BATCH_MS", "50") or 50)
+
+        # Одно фоновое обновление промпта на всех вызывающих; пока оно идёт,
+        # ask() продолжает работать со старым промптом.
+        self._prompt_refresh_task: Optional[asyncio.Task] = None
+        self._prompt_refresh_forced = False
+
+        # Состояние провайдера не меняется между запросами — считаем один раз.
+        self._enabled = False
+        self.invalidate_provider_cache()
         logger.info(f"AIService активен с провайдером: {self.get_provider_name()}")
 
     def is_enabled(self) -> bool:
-        return bool(self.service) and self.service.is_enabled()
+        return self._enabled
+
+    def invalidate_provider_cache(self) -> None:
+        """Пересчитывает закэшированную доступность провайдера."""
+        self._enabled = bool(self.service) and self.service.is_enabled()
 
     async def initialize(self) -> None:
-        if self.service and hasattr(self.service, "initialize"):
-            await self.service.initialize()
+        if not self.service:
+            return
+        # Прогрев соединения идёт параллельно с загрузкой промпта.
+        steps = []
+        if hasattr(self.service, "initialize"):
+            steps.append(self.service.initialize())
+        if self._enabled and hasattr(self.service, "warmup"):
+            steps.append(self.service.warmup())
+        if steps:
+            await asyncio.gather(*steps)
+        self.invalidate_provider_cache()
 
     async def wait_for_ready(self) -> bool:
         if self.service and hasattr(self.service, "wait_for_ready"):
@@ -45,14 +98,110 @@ class AIService:
         content: str,
         external_history: Optional[str] = None,
         system_context: Optional[str] = None,
+    ) -> Optional[str]:
+        if not self._enabled:
+            logger.error("AI провайдер %s недоступен", self.provider_name)
+            return None
+        key = (user_id, content, external_history or "", system_context or "")
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(
+                self._ask_uncoalesced(user_id, content, external_history, system_context)
+            )
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._schedule_inflight_expiry(key, f))
+        else:
+            logger.debug("Coalesced duplicate AI request for user %s", user_id)
+        # shield: отмена одного из ожидающих не должна отменять общий вызов.
+        return await asyncio.shield(future)
+
+    def _schedule_inflight_expiry(self, key: Tuple[int, str, str, str], future: asyncio.Future) -> None:
+        if future.cancelled() or future.exception() is not None or not future.result():
+            self._expire_inflight(key, future)
+            return
+        asyncio.get_running_loop().call_later(
+            self.inflight_ttl, self._expire_inflight, key, future
+        )
+
+    def _expire_inflight(self, key: Tuple[int, str, str, str], future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+
+    async def _ask_uncoalesced(
+        self,
+        user_id: int,
+        content: str,
+        external_history: Optional[str],
+        system_context: Optional[str],
+    ) -> Optional[str]:
+        if not self.hedging_enabled or self.max_hedges == 0:
+            return await self._ask_one(user_id, content, external_history, system_context)
+        return await self._ask_hedged(user_id, content, external_history, system_context)
+
+    async def _ask_one(
+        self,
+        user_id: int,
+        content: str,
+        external_history: Optional[str],
+        system_context: Optional[str],
+        **kwargs,
     ) -> Optional[str]:
         return await self.service.ask(
             user_id,
             content,
             external_history=external_history,
             system_context=system_context,
+            **kwargs,
         )
 
+    async def _ask_hedged(
+        self,
+        user_id: int,
+        content: str,
+        external_history: Optional[str],
+        system_context: Optional[str],
+    ) -> Optional[str]:
+        """Запускает основной вызов и до max_hedges дублей с задержкой hedge_delay.
+
+        Возвращает первый непустой ответ, оставшиеся задачи отменяются.
+        Попытки не пишут историю сами: её записывает только победитель.
+        """
+        pending = set()
+        launched = 0
+        try:
+            while True:
+                if launched <= self.max_hedges:
+                    pending.add(asyncio.create_task(
+                        self._ask_one(
+                            user_id, content, external_history, system_context,
+                            record_history=False,
+                        )
+                    ))
+                    launched += 1
+                if not pending:
+                    return None
+
+                timeout = self.hedge_delay if launched <= self.max_hedges else None
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        logger.warning("Hedged AI call failed: %s", task.exception())
+                        continue
+                    if task.result():
+                        if launched > 1:
+                            logger.info(
+                                "Hedged AI call won after %d launches for user %s",
+                                launched,
+                                user_id,
+                            )
+                        self.service.record_exchange(user_id, content, task.result())
+                        return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
     async def ask_stream(
         self,
         user_id: int,
@@ -60,13 +209,40 @@ class AIService:
         external_history: Optional[str] = None,
         system_context: Optional[str] = None,
     ) -> AsyncGenerator[str, None]:
+        max_delay = self.stream_batch_ms / 1000
+        buf = []
+        buf_len = 0
+        last_flush = time.monotonic()
         async for chunk in self.service.ask_stream(
             user_id,
             content,
             external_history=external_history,
             system_context=system_context,
         ):
-            yield chunk
+            # Служебные маркеры (__ERROR__, __TOOL_CALL__) не склеиваем с текстом.
+            if chunk.startswith("__"):
+                if buf:
+                    yield "".join(buf)
+                    buf.clear()
+                    buf_len = 0
+                yield chunk
+                last_flush = time.monotonic()
+                await asyncio.sleep(0)
+                continue
+
+            buf.append(chunk)
+            buf_len += len(chunk)
+            now = time.monotonic()
+            if buf_len >= self.stream_batch_chars or now - last_flush >= max_delay:
+                yield "".join(buf)
+                buf.clear()
+                buf_len = 0
+                last_flush = now
+                # Отдаём управление циклу только после флеша: если upstream
+                # отдаёт чанки без реальных await, остальные задачи не голодают.
+                await asyncio.sleep(0)
+        if buf:
+            yield "".join(buf)
 
     def get_provider_name(self) -> str:
         return self.provider_name
@@ -75,6 +251,7 @@ class AIService:
         return self.backend_name
 
     async def force_refresh_rag(self) -> bool:
+        self.invalidate_provider_cache()
         logger.info(
             "force_refresh_rag requested for backend %s; separate RAG refresh is not required.",
             self.backend_name,
@@ -90,10 +267,49 @@ class AIService:
             self.service.clear_history(user_id)
 
     async def refresh_system_prompt(self, force: bool = False) -> bool:
-        if self.service:
-            return await self.service.refresh_system_prompt(force=force)
-        return False
+        """Обновляет системный промпт без блокировки читателей.
+
+        Конкурентные вызовы разделяют одну фоновую задачу. Без force
+        возвращает True сразу (текущий промпт остаётся в работе до замены),
+        с force — дожидается результата обновления.
+        """
+        if not self.service:
+            return False
+        task = self._start_prompt_refresh(force)
+        if not force:
+            return True
+        return await asyncio.shield(task)
+
+    def _start_prompt_refresh(self, force: bool) -> asyncio.Task:
+        task = self._prompt_refresh_task
+        if task is not None and not task.done() and (self._prompt_refresh_forced or not force):
+            return task
+        task = asyncio.create_task(self.service.refresh_system_prompt(force=force))
+        task.add_done_callback(self._on_prompt_refresh_done)
+        self._prompt_refresh_task = task
+        self._prompt_refresh_forced = force
+        return task
+
+    @staticmethod
+    def _on_prompt_refresh_done(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Ошибка фонового обновления системного промпта: %s", task.exception())
 
     async def close(self) -> None:
         if self.service:
             await self.service.close()
+
+
+_ai_service: Optional[AIService] = None
+
+
+def get_ai_service(promotions_gateway: Optional[AsyncGoogleSheetsGateway] = None) -> AIService:
+    """Возвращает общий на процесс AIService (создаётся при первом вызове).
+
+    Повторные вызовы не пересоздают клиента провайдера; promotions_gateway
+    учитывается только при первом создании.
+    """
+    global _ai_service
+    if _ai_service is None:
+        _ai_service = AIService(promotions_gateway=promotions_gateway)
+    return _ai_service
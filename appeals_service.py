@@ -3,9 +3,14 @@
 Адаптирован под структуру листа 'обращения'.
 """
 
+import asyncio
 import logging
 import datetime
-from typing import Optional, List, Dict
+import os
+import re
+import time
+from typing import Optional, List, Dict, Tuple
+from gspread.exceptions import APIError
 from sheets_gateway import (
     _get_appeals_client_and_sheet,
     AsyncGoogleSheetsGateway,
@@ -15,6 +20,88 @@ from utils import mask_phone, mask_telegram_id, mask_fio
 
 logger = logging.getLogger(__name__)
 
+# Время жизни снимка листа 'обращения' в памяти (секунды)
+_RECORDS_TTL = int(os.environ.get('APPEALS_RECORDS_TTL', '30'))
+# Время жизни индекса telegram_id -> строка, построенного по колонке D (секунды).
+# Строки может переставить оператор (сортировка, удаление), поэтому индекс
+# живет недолго, а дописывание истории сверяет telegram_id строки перед записью
+_INDEX_TTL = int(os.environ.get('APPEALS_INDEX_TTL', '60'))
+# Задержка записи правок существующих строк (секунды): правки, пришедшие за
+# это время (сообщение пользователя, ответ ИИ, статус), уходят одним batchUpdate
+_WRITE_DELAY = float(os.environ.get('APPEALS_WRITE_DELAY', '0.5'))
+# Пауза перед повтором записи очереди после ошибки (секунды)
+_WRITE_RETRY_DELAY = float(os.environ.get('APPEALS_WRITE_RETRY_DELAY', '30'))
+# Сколько раз пробуем записать правку строки при временных ошибках (каждая
+# попытка уже включает повторы внутри gateway); после этого правка отбрасывается
+_WRITE_MAX_ATTEMPTS = int(os.environ.get('APPEALS_WRITE_MAX_ATTEMPTS', '3'))
+# Не удалась настройка условного форматирования - повторяем при записях,
+# но не чаще раза в столько секунд
+_FORMATS_RETRY_DELAY = 60
+# Сколько помнить записанные пачки правок (секунды): чтение, начатое до
+# окончания записи, может их не увидеть, и они накладываются поверх
+_WRITTEN_KEEP = 300
+
+# Колонки, которые бот правит в существующих строках -> ключ записи в снимке
+_COLUMN_KEYS = {
+    'E': 'текст_обращений',
+    'F': 'статус',
+    'G': 'специалист_ответ',
+    'H': 'время_обновления',
+    'I': 'контекст_памяти',
+}
+
+# Заливка ячейки статуса (колонка F)
+_FILL_RED = {"red": 0.95, "green": 0.8, "blue": 0.8}      # #f3cccc
+_FILL_WHITE = {"red": 1.0, "green": 1.0, "blue": 1.0}     # #ffffff
+_FILL_YELLOW = {"red": 1.0, "green": 0.95, "blue": 0.8}   # #fff2cc
+_FILL_GREEN = {"red": 0.85, "green": 0.92, "blue": 0.83}  # #d9ead3
+
+# Правила условного форматирования колонки F: статус -> заливка.
+# Создаются один раз, поэтому записи статуса не требуют отдельного format()
+_STATUS_FILLS = {
+    'Новое': _FILL_RED,
+    'Передано специалисту': _FILL_RED,
+    'Ответ ИИ': _FILL_WHITE,
+    'В работе': _FILL_YELLOW,
+    'Решено': _FILL_GREEN,
+}
+
+_STATUS_COL = 6  # F
+
+# Начало записи истории обращений: "YYYY-MM-DD HH:MM:SS: текст"
+_ENTRY_PREFIX = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}): ', re.M)
+
+# Маркеры, которые бот добавляет в историю при закрытии обращения
+# (оба варианта сообщения из response_monitor), одним проходом по тексту
+_CLOSED_MARKER = re.compile(r'✅ Ваше обращение (?:решено|отмечено как решенное специалистом\.)')
+
+# Номер строки в A1-диапазоне ответа values.append: "'обращения'!A17:H17" -> 17
+_RANGE_ROW = re.compile(r'![A-Z]+(\d+)')
+
+# Лимит текста одной ячейки (50% от максимума Google Sheets) и пометка об усечении
+_GS_CELL_LIMIT = 25000
+_TRUNC_SUFFIX = "\n[...] (усечено до лимита Google Sheets)"
+
+
+# Последняя отформатированная текущая секунда: (int(time.time()), строка)
+_last_ts: Tuple[int, str] = (0, '')
+
+
+def _ts(dt: Optional[datetime.datetime] = None) -> str:
+    """
+    Время в формате листа 'YYYY-MM-DD HH:MM:SS' (без разбора формата strftime).
+    Текущее время форматируется не чаще раза в секунду.
+    """
+    global _last_ts
+    if dt is None:
+        now = time.time()
+        if _last_ts[0] == int(now):
+            return _last_ts[1]
+        dt = datetime.datetime.fromtimestamp(now)
+        _last_ts = (int(now), _ts(dt))
+        return _last_ts[1]
+    return f'{dt.year:04d}-{dt.month:02d}-{dt.day:02d} {dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}'
+
 
 class AppealsService:
     """Сервис для работы с обращениями в листе 'обращения'."""
@@ -24,6 +111,38 @@ class AppealsService:
         self.worksheet = None
         self.gateway = gateway or AsyncGoogleSheetsGateway(circuit_breaker_name='appeals')
         
+        # Снимок листа и индекс telegram_id -> номер строки; собственные записи
+        # переносятся в снимок
+        self._records: Optional[List[Dict]] = None
+        self._records_ts = 0.0
+        self._index: Dict[str, int] = {}
+        self._records_lock = asyncio.Lock()
+        
+        # Долгоживущий индекс по колонке D для путей, которым нужен только номер строки
+        self._row_idx: Optional[Dict[str, int]] = None
+        self._row_idx_ts = 0.0
+        
+        # Записи из листа бот не удаляет: раз найденные, они уже есть всегда
+        self._has_records = False
+        
+        # Отложенные правки существующих строк: номер строки -> {колонка: значение}
+        self._pending: Dict[int, Dict[str, object]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        # Пачка, которая пишется сейчас, и недавно записанные пачки
+        # (порядковый номер записи, время, правки); номер растет с каждой записью
+        self._inflight: Dict[int, Dict[str, object]] = {}
+        self._written: List[Tuple[int, float, Dict[int, Dict[str, object]]]] = []
+        self._write_seq = 0
+        # Вызывающие, ждущие записи правок строки, и число неудачных попыток по строкам
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+        self._attempts: Dict[int, int] = {}
+        
+        # Правила условного форматирования статусов: настроены ли и когда пробовали
+        self._formats_ready = False
+        self._formats_attempt_ts = 0.0
+        self._formats_task: Optional[asyncio.Task] = None
+        
         # Синхронная инициализация
         try:
             client, worksheet = _get_appeals_client_and_sheet()
@@ -33,10 +152,412 @@ class AppealsService:
         except Exception as e:
             logger.error(f"Не удалось инициализировать лист 'обращения': {e}")
 
+    async def initialize(self):
+        """
+        Асинхронный прогрев после запуска event loop: индекс строк (одно чтение
+        колонки D) и правила условного форматирования статусов.
+        Не задерживает старт бота; без него индекс строится при первом обращении,
+        а форматирование настраивается при следующих записях.
+        """
+        if not self.is_available():
+            return
+        try:
+            index = await self._row_index()
+            logger.info(f"Индекс обращений построен: {len(index)} пользователей")
+        except Exception as e:
+            logger.warning(f"Не удалось построить индекс обращений при старте: {e}")
+        await self._setup_formats()
+
     def is_available(self) -> bool:
         """Проверяет доступность сервиса обращений."""
         return self.worksheet is not None and self.gateway is not None
 
+    async def _snapshot(self) -> Tuple[List[Dict], Dict[str, int]]:
+        """
+        Возвращает записи листа и индекс telegram_id -> номер строки.
+        
+        Лист читается один раз на _RECORDS_TTL секунд (или после записи);
+        одновременные вызовы ждут одно и то же чтение.
+        """
+        async with self._records_lock:
+            if not self._snapshot_is_fresh():
+                seq = self._write_seq
+                records = await self.gateway.get_all_records(self.worksheet, use_cache=False)
+                self._records = records
+                self._index = self._build_tid_index(records)
+                self._records_ts = time.monotonic()
+                self._set_row_index(self._index)
+                # Собственные правки, которых в прочитанном листе может не быть
+                for row, cells in self._edits_since(seq).items():
+                    self._patch_snapshot(row, self._as_record(cells))
+            return self._records, self._index
+
+    def _snapshot_is_fresh(self) -> bool:
+        """Есть ли снимок листа, который еще не устарел."""
+        return self._records is not None and time.monotonic() - self._records_ts < _RECORDS_TTL
+
+    async def _get_telegram_id_column(self) -> List[str]:
+        """Колонка D (telegram_id) без заголовка."""
+        return (await self._fetch_columns(['D']))['D']
+
+    async def _row_index(self) -> Dict[str, int]:
+        """
+        Индекс telegram_id -> номер строки для путей, которым нужен только номер строки.
+        
+        Берется из снимка, если он свежий, иначе читается одна колонка D
+        вместо всего листа.
+        """
+        if self._snapshot_is_fresh():
+            return self._index
+        if self._row_idx is None or time.monotonic() - self._row_idx_ts >= _INDEX_TTL:
+            self._set_row_index(self._index_from_column(await self._get_telegram_id_column()))
+        return self._row_idx
+
+    async def _row_history(self, telegram_id: int) -> Tuple[Optional[int], str]:
+        """
+        Номер строки пользователя и его история обращений (колонка E).
+        
+        При свежем снимке оба значения берутся из него, иначе строка ищется
+        по индексу колонки D и читаются ячейки D:E этой строки. Если в D уже
+        другой telegram_id (строки переставили), индекс сбрасывается и поиск
+        повторяется по заново прочитанной колонке D.
+        """
+        tid_str = str(telegram_id)
+        if self._snapshot_is_fresh():
+            row = self._index.get(tid_str)
+            return row, str(self._records[row - 2].get('текст_обращений', '') or '') if row else ''
+        
+        for _ in range(2):
+            row = (await self._row_index()).get(tid_str)
+            if not row:
+                return None, ''
+            seq = self._write_seq
+            values = (await self.gateway.batch_get(self.worksheet, [f'D{row}:E{row}']))[0]
+            cells = values[0] if values else []
+            if str(cells[0] if cells else '') != tid_str:
+                logger.warning(
+                    "Строка %s больше не принадлежит пользователю %s, индекс обращений перестраивается",
+                    row, mask_telegram_id(telegram_id)
+                )
+                self._invalidate()
+                continue
+            # Собственные правки новее прочитанного (в том числе дописанные во время чтения)
+            staged = self._edits_since(seq).get(row, {})
+            if 'E' in staged:
+                return row, str(staged['E'])
+            return row, str(cells[1]) if len(cells) > 1 else ''
+        return None, ''
+
+    def _set_row_index(self, index: Dict[str, int]) -> None:
+        """Запоминает индекс telegram_id -> номер строки."""
+        self._row_idx = index
+        self._row_idx_ts = time.monotonic()
+
+    @staticmethod
+    def _index_from_column(telegram_ids: List) -> Dict[str, int]:
+        """Строит индекс telegram_id -> номер строки по значениям колонки D (со строки 2)."""
+        index: Dict[str, int] = {}
+        for i, telegram_id in enumerate(telegram_ids, start=2):
+            if telegram_id:
+                # При дублях побеждает первая строка, как при линейном поиске
+                index.setdefault(str(telegram_id), i)
+        return index
+
+    @staticmethod
+    def _build_tid_index(records: List[Dict]) -> Dict[str, int]:
+        """Строит индекс telegram_id -> номер строки листа."""
+        return AppealsService._index_from_column([record.get('telegram_id', '') for record in records])
+
+    def _invalidate(self) -> None:
+        """Сбрасывает снимок листа и индекс строк."""
+        self._records = None
+        self._row_idx = None
+
+    def _patch_snapshot(self, row: int, values: Dict[str, object]) -> None:
+        """
+        Переносит в снимок собственную запись в существующую строку.
+        
+        Так следующий вызов в том же сценарии (например, set_status_in_work,
+        затем add_ai_response) не перечитывает весь лист.
+        """
+        if self._records is not None and 0 <= row - 2 < len(self._records):
+            self._records[row - 2].update(values)
+
+    @staticmethod
+    def _as_record(cells: Dict[str, object]) -> Dict[str, object]:
+        """Переводит {колонка: значение} в ключи записи снимка."""
+        return {_COLUMN_KEYS[col]: value for col, value in cells.items()}
+
+    def _stage(self, row: int, cells: Dict[str, object]) -> asyncio.Future:
+        """
+        Ставит правки ячеек существующей строки в очередь записи и сразу
+        переносит их в снимок.
+        
+        Очередь сбрасывается через _WRITE_DELAY секунд одним batchUpdate;
+        повторная правка той же ячейки заменяет предыдущую. Возвращает future,
+        который завершается, когда правки строки записаны, или получает ошибку
+        записи, если они отброшены.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(row, {}).update(cells)
+        self._waiters.setdefault(row, []).append(future)
+        self._patch_snapshot(row, self._as_record(cells))
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+        return future
+
+    async def _delayed_flush(self, delay: float = _WRITE_DELAY) -> None:
+        """Сбрасывает очередь правок по таймеру."""
+        await asyncio.sleep(delay)
+        self._flush_task = None
+        await self.flush()
+
+    def _edits_since(self, seq: int) -> Dict[int, Dict[str, object]]:
+        """
+        Собственные правки, которых может не быть в чтении, начатом при
+        self._write_seq == seq: записанные после его начала, идущая запись и
+        очередь. Более новые значения перекрывают старые.
+        """
+        edits: Dict[int, Dict[str, object]] = {}
+        batches = [batch for batch_seq, _, batch in self._written if batch_seq > seq]
+        for batch in batches + [self._inflight, self._pending]:
+            for row, cells in batch.items():
+                edits.setdefault(row, {}).update(cells)
+        return edits
+
+    async def flush(self) -> None:
+        """
+        Записывает накопленные правки строк одним batchUpdate.
+        Вызывается по таймеру и при остановке бота.
+        
+        Пачки пишутся строго по одной (лок держат только записывающие, чтение
+        не ждет). Строки, которые записать не удалось, обрабатывает
+        _requeue_or_drop; ожидающие в _stage узнают итог по своей строке.
+        """
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            waiters, self._waiters = self._waiters, {}
+            if not pending:
+                return
+            self._inflight = pending
+            try:
+                failed = await self._write_rows(pending)
+            finally:
+                self._inflight = {}
+            
+            written = {row: cells for row, cells in pending.items() if row not in failed}
+            if written:
+                now = time.monotonic()
+                self._write_seq += 1
+                self._written = [entry for entry in self._written if now - entry[1] < _WRITTEN_KEEP]
+                self._written.append((self._write_seq, now, written))
+                logger.debug("Записаны правки %d строк обращений одним batchUpdate", len(written))
+                self._schedule_format_setup()
+            for row in written:
+                self._attempts.pop(row, None)
+                for future in waiters.get(row, ()):
+                    if not future.done():
+                        future.set_result(None)
+            for row, error in failed.items():
+                self._requeue_or_drop(row, pending[row], waiters.get(row, []), error)
+
+    @staticmethod
+    def _cell_updates(rows: Dict[int, Dict[str, object]]) -> List[Dict]:
+        """Переводит {строка: {колонка: значение}} в данные для batch_update."""
+        return [
+            {'range': f'{col}{row}', 'values': [[value]]}
+            for row, cells in rows.items()
+            for col, value in cells.items()
+        ]
+
+    @staticmethod
+    def _is_permanent_error(error: Exception) -> bool:
+        """Ошибка, которую повтор не исправит: 4xx от Sheets API, кроме 429."""
+        return isinstance(error, APIError) and 400 <= error.code < 500 and error.code != 429
+
+    async def _write_rows(self, rows: Dict[int, Dict[str, object]]) -> Dict[int, Exception]:
+        """
+        Пишет правки строк одним batchUpdate.
+        
+        Если пачку отклонила постоянная ошибка (например, строка за пределами
+        листа после удаления строк или защищенный диапазон), строки пишутся по
+        одной, чтобы одна плохая строка не блокировала правки остальных.
+        
+        Returns:
+            Dict[int, Exception]: ошибки строк, которые записать не удалось
+        """
+        try:
+            await self.gateway.batch_update(self.worksheet, self._cell_updates(rows))
+            return {}
+        except Exception as e:
+            if len(rows) == 1 or not self._is_permanent_error(e):
+                return {row: e for row in rows}
+            logger.warning(f"Пачка правок обращений ({len(rows)} строк) отклонена, строки пишутся по одной: {e}")
+        
+        failed: Dict[int, Exception] = {}
+        for row, cells in rows.items():
+            try:
+                await self.gateway.batch_update(self.worksheet, self._cell_updates({row: cells}))
+            except Exception as e:
+                failed[row] = e
+        return failed
+
+    def _requeue_or_drop(self, row: int, cells: Dict[str, object], waiters: List[asyncio.Future], error: Exception) -> None:
+        """
+        Возвращает незаписанные правки строки в очередь или отбрасывает их.
+        
+        При временной ошибке правки возвращаются в очередь - более поздние
+        правки тех же ячеек не затираются - и запись повторяется через
+        _WRITE_RETRY_DELAY секунд, всего не более _WRITE_MAX_ATTEMPTS попыток:
+        номера строк со временем могут устареть. Постоянную ошибку повтор не
+        исправит - правки отбрасываются сразу, ожидающие получают ошибку.
+        """
+        attempts = self._attempts.pop(row, 0) + 1
+        if not self._is_permanent_error(error) and attempts < _WRITE_MAX_ATTEMPTS:
+            logger.error(
+                f"Ошибка записи правок строки обращений {row} (попытка {attempts}/{_WRITE_MAX_ATTEMPTS}), "
+                f"повтор через {_WRITE_RETRY_DELAY:g} сек: {error}"
+            )
+            self._attempts[row] = attempts
+            staged = self._pending.setdefault(row, {})
+            for col, value in cells.items():
+                staged.setdefault(col, value)
+            self._waiters.setdefault(row, [])[:0] = waiters
+            if self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._delayed_flush(_WRITE_RETRY_DELAY))
+            return
+        
+        logger.error(f"Правки строки обращений {row} отброшены после {attempts} попыток ({', '.join(cells)}): {error}")
+        # Снимок и индекс уже содержат отброшенные правки, а строки могли сдвинуться
+        self._invalidate()
+        for future in waiters:
+            if not future.done():
+                future.set_exception(error)
+
+    def _append_to_snapshot(self, row_data: List, row: Optional[int]) -> None:
+        """
+        Переносит добавленную строку в индекс строк и в снимок.
+        
+        Номер строки берется из ответа API; если он неизвестен, сбрасывается
+        все, а если строка не продолжает снимок (или в нем нет заголовков) -
+        только снимок.
+        """
+        if row is None:
+            self._invalidate()
+            return
+        telegram_id = str(row_data[3])  # колонка D
+        if self._row_idx is not None:
+            self._row_idx.setdefault(telegram_id, row)
+        if not self._records or row != len(self._records) + 2:
+            self._records = None
+            return
+        keys = list(self._records[0].keys())
+        self._records.append(dict(zip(keys, list(row_data) + [''] * (len(keys) - len(row_data)))))
+        self._index.setdefault(telegram_id, row)
+
+    async def _fetch_columns(self, cols: List[str]) -> Dict[str, List[str]]:
+        """
+        Читает только нужные колонки (без заголовка) одним values.batchGet.
+        
+        Args:
+            cols: буквы колонок, например ['D', 'G']
+            
+        Returns:
+            Dict[str, List[str]]: колонка -> значения начиная со строки 2
+            (хвостовые пустые ячейки Sheets не возвращает)
+        """
+        seq = self._write_seq
+        ranges = await self.gateway.batch_get(self.worksheet, [f'{c}2:{c}' for c in cols], major_dimension='COLUMNS')
+        columns = {c: (list(values[0]) if values else []) for c, values in zip(cols, ranges)}
+        # Собственные правки, которых в прочитанных колонках может не быть
+        for row, cells in self._edits_since(seq).items():
+            for col, value in cells.items():
+                if col in columns:
+                    column = columns[col]
+                    if len(column) < row - 1:
+                        column.extend([''] * (row - 1 - len(column)))
+                    column[row - 2] = value
+        return columns
+
+    async def _setup_formats(self) -> None:
+        """Настраивает условное форматирование статусов; ошибку только логирует."""
+        self._formats_attempt_ts = time.monotonic()
+        try:
+            await self._ensure_conditional_formats()
+            self._formats_ready = True
+        except Exception as e:
+            logger.warning(f"Не удалось настроить условное форматирование статусов: {e}")
+        finally:
+            self._formats_task = None
+
+    def _schedule_format_setup(self) -> None:
+        """
+        Повторяет в фоне настройку условного форматирования, если она еще не
+        удалась (например, при старте), не чаще раза в _FORMATS_RETRY_DELAY секунд.
+        """
+        if self._formats_ready or self._formats_task is not None:
+            return
+        if time.monotonic() - self._formats_attempt_ts < _FORMATS_RETRY_DELAY:
+            return
+        self._formats_task = asyncio.create_task(self._setup_formats())
+
+    @staticmethod
+    def _covers_status_column(grid_range: Dict, sheet_id: int) -> bool:
+        """Диапазон правила - колонка F этого листа со второй строки (или целиком)."""
+        # Нулевые поля GridRange API не возвращает
+        return (grid_range.get('sheetId', 0) == sheet_id
+                and grid_range.get('startColumnIndex', 0) == _STATUS_COL - 1
+                and grid_range.get('endColumnIndex') == _STATUS_COL
+                and grid_range.get('startRowIndex', 0) <= 1
+                and 'endRowIndex' not in grid_range)
+
+    async def _ensure_conditional_formats(self) -> None:
+        """
+        Создает (один раз) правила условного форматирования колонки F по статусу.
+        Уже существующие правила для этих статусов на колонке F не дублируются;
+        правило с тем же текстом на другом диапазоне не считается.
+        """
+        metadata = await self.gateway.fetch_sheet_metadata(
+            self.worksheet, {'fields': 'sheets(properties.sheetId,conditionalFormats)'}
+        )
+        sheet_id = self.worksheet.id
+        existing = set()
+        for sheet in metadata.get('sheets', []):
+            if sheet.get('properties', {}).get('sheetId', 0) != sheet_id:
+                continue
+            for rule in sheet.get('conditionalFormats', []):
+                if not any(self._covers_status_column(r, sheet_id) for r in rule.get('ranges', [])):
+                    continue
+                condition = rule.get('booleanRule', {}).get('condition', {})
+                values = condition.get('values') or [{}]
+                if condition.get('type') == 'TEXT_EQ':
+                    existing.add(values[0].get('userEnteredValue'))
+        
+        status_range = {
+            'sheetId': sheet_id,
+            'startRowIndex': 1,  # без заголовка
+            'startColumnIndex': _STATUS_COL - 1,
+            'endColumnIndex': _STATUS_COL
+        }
+        requests = [{'addConditionalFormatRule': {
+            'rule': {
+                'ranges': [status_range],
+                'booleanRule': {
+                    'condition': {'type': 'TEXT_EQ', 'values': [{'userEnteredValue': status}]},
+                    'format': {'backgroundColor': fill}
+                }
+            },
+            'index': 0
+        }} for status, fill in _STATUS_FILLS.items() if status not in existing]
+        
+        if requests:
+            await self.gateway.spreadsheet_batch_update(self.worksheet, requests)
+            logger.info(f"Добавлено {len(requests)} правил условного форматирования статусов")
+
     async def create_appeal(self, code: str, phone: str, fio: str, telegram_id: int, text: str) -> bool:
         """
         Создает или обновляет обращение в листе (накопление в одной ячейке).
@@ -57,28 +578,16 @@ class AppealsService:
 
         try:
             logger.info(f"Создание обращения для telegram_id={mask_telegram_id(telegram_id)}, code={code}, phone={mask_phone(phone)}, fio={mask_fio(fio)}")
-            # Ищем существующую строку для этого telegram_id
-            records = await self.gateway.get_all_records(self.worksheet)
-            logger.info(f"Получено {len(records)} записей из таблицы обращений")
-            existing_row = None
-            
-            for i, record in enumerate(records, start=2):  # start=2 потому что строка 1 - заголовки
-                # Ищем telegram_id в колонке D (индекс 3 в массиве)
-                record_telegram_id = str(record.get('telegram_id', ''))
-                logger.info(f"Проверка записи {i}: telegram_id='{mask_telegram_id(record_telegram_id)}' vs '{mask_telegram_id(telegram_id)}'")
-                if record_telegram_id == str(telegram_id):
-                    existing_row = i
-                    logger.info(f"Найдена существующая строка {i} для telegram_id {mask_telegram_id(telegram_id)}")
-                    break
-            
-            timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            # Ищем существующую строку для этого telegram_id и ее обращения (колонка E)
+            existing_row, current_appeals = await self._row_history(telegram_id)
+            if existing_row:
+                logger.debug("Найдена существующая строка %s для telegram_id %s", existing_row, mask_telegram_id(telegram_id))
+            
+            timestamp = _ts()
             new_appeal = f"{timestamp}: {text}"
             
             if existing_row:
                 # Обновляем существующую строку - накапливаем обращения в одной ячейке
-                cell = await self.gateway.cell(self.worksheet, existing_row, 5)
-                current_appeals = cell.value or ""  # колонка E
-                
                 # Добавляем новое обращение сверху
                 if current_appeals.strip():
                     updated_appeals = f"{new_appeal}\n{current_appeals}"
@@ -90,20 +599,13 @@ class AppealsService:
                 # Усечение под лимит Google Sheets
                 updated_appeals = self._truncate_to_gs_limit(updated_appeals)
                 
-                # Обновляем ячейку с обращениями и время обновления через batch_update
-                await self.gateway.batch_update(self.worksheet, [{
-                    'range': f'E{existing_row}',
-                    'values': [[updated_appeals]]
-                }, {
-                    'range': f'H{existing_row}',
-                    'values': [[timestamp]]
-                }])
+                # Обновляем ячейку с обращениями и время обновления
+                await self._stage(existing_row, {'E': updated_appeals, 'H': timestamp})
                 
                 logger.info(f"Обновлено обращение для пользователя {mask_telegram_id(telegram_id)} (строка {existing_row})")
             else:
-                # Создаем новую строку
-                next_row = len(records) + 2  # +2 потому что records не включает заголовок
-                logger.info(f"Создание новой строки {next_row} для telegram_id {mask_telegram_id(telegram_id)}")
+                # Создаем новую строку; ее номер сообщает ответ API
+                logger.debug("Создание новой строки для telegram_id %s", mask_telegram_id(telegram_id))
                 
                 row_data = [
                     code,
@@ -116,22 +618,14 @@ class AppealsService:
                     timestamp  # время_обновления (колонка H)
                 ]
                 
-                logger.info(f"Данные для записи: {row_data}")
-                await self.gateway.append_row(self.worksheet, row_data)
-                
-                # Устанавливаем заливку #f3cccc (светло-красный) для статуса "Новое"
-                try:
-                    logger.info(f"Попытка установить заливку #f3cccc для новой ячейки F{next_row}")
-                    await self.gateway.format(self.worksheet, f'F{next_row}', {
-                        "backgroundColor": {
-                            "red": 0.95,    # #f3cccc
-                            "green": 0.8,
-                            "blue": 0.8
-                        }
-                    })
-                    logger.info(f"Заливка успешно установлена для ячейки F{next_row}")
-                except Exception as format_error:
-                    logger.error(f"Ошибка при установке заливки для ячейки F{next_row}: {format_error}", exc_info=True)
+                logger.debug("Данные для записи: %s", row_data)
+                # Заливку статуса задает условное форматирование колонки F
+                response = await self.gateway.append_row(self.worksheet, row_data)
+                match = _RANGE_ROW.search(((response or {}).get('updates') or {}).get('updatedRange', ''))
+                next_row = int(match.group(1)) if match else None
+                self._append_to_snapshot(row_data, next_row)
+                self._has_records = True
+                self._schedule_format_setup()
                 
                 logger.info(f"Создано новое обращение для пользователя {mask_telegram_id(telegram_id)} (строка {next_row})")
             
@@ -158,88 +652,79 @@ class AppealsService:
             if not appeals_text.strip():
                 return appeals_text
                 
-            cutoff_date = datetime.datetime.now() - datetime.timedelta(days=30)
-            lines = appeals_text.split('\n')
-            cleaned_lines = []
+            # Формат YYYY-MM-DD HH:MM:SS упорядочен лексикографически так же,
+            # как даты, поэтому сравниваем строки без разбора в datetime
+            cutoff_str = _ts(datetime.datetime.now() - datetime.timedelta(days=30))
             
-            for line in lines:
-                if not line.strip():
+            # Удаляем только устаревшие строки-записи ("дата: текст"); строки
+            # без даты (ответы ИИ, маркер закрытия, продолжения сообщений)
+            # остаются на месте. Текст на строки не разбиваем: вырезаем
+            # найденные строки срезами
+            pieces = []
+            pos = 0
+            for match in _ENTRY_PREFIX.finditer(appeals_text):
+                stamp = match.group(1)
+                if stamp >= cutoff_str:
                     continue
-                    
-                # Пытаемся извлечь дату из начала строки (формат: YYYY-MM-DD HH:MM:SS)
+                # Перед удалением убеждаемся, что дата корректна (редкий путь)
                 try:
-                    if len(line) >= 19 and line[4] == '-' and line[7] == '-':
-                        date_str = line[:19]
-                        appeal_date = datetime.datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S')
-                        
-                        if appeal_date >= cutoff_date:
-                            cleaned_lines.append(line)
-                        else:
-                            logger.debug(f"Удалено старое обращение: {line[:50]}...")
-                    else:
-                        # Если не удается распарсить дату, оставляем строку
-                        cleaned_lines.append(line)
+                    datetime.datetime.fromisoformat(stamp)
                 except ValueError:
                     # Если ошибка парсинга даты, оставляем строку
-                    cleaned_lines.append(line)
+                    continue
+                end = appeals_text.find('\n', match.end())
+                end = len(appeals_text) if end == -1 else end + 1
+                logger.debug(f"Удалено старое обращение: {appeals_text[match.start():match.start() + 50]}...")
+                pieces.append(appeals_text[pos:match.start()])
+                pos = end
             
-            return '\n'.join(cleaned_lines)
+            if not pieces:
+                return appeals_text
+            pieces.append(appeals_text[pos:])
+            return ''.join(pieces).rstrip('\n')
             
         except Exception as e:
             logger.error(f"Ошибка очистки старых обращений: {e}")
             return appeals_text
 
-    def _truncate_to_gs_limit(self, text: str, limit: int = 25000) -> str:
+    def _truncate_to_gs_limit(self, text: str, limit: int = _GS_CELL_LIMIT) -> str:
         """
         Ограничивает длину текста для одной ячейки Google Sheets (лимит 50% от максимума = 25k символов).
         Сохраняем новые сообщения (в начале текста), добавляя пометку об усечении в конце.
         """
-        try:
-            if text is None:
-                return ""
-            if len(text) <= limit:
-                return text
-            suffix = "\n[...] (усечено до лимита Google Sheets)"
-            keep = max(0, limit - len(suffix))
-            # Берем первые символы (новые записи сверху), а не последние
-            return text[:keep] + suffix
-        except Exception:
-            return text[:limit]
+        if text is None:
+            return ""
+        if len(text) <= limit:
+            return text
+        # Берем первые символы (новые записи сверху), а не последние
+        return text[:max(0, limit - len(_TRUNC_SUFFIX))] + _TRUNC_SUFFIX
 
     async def get_raw_history(self, telegram_id: int) -> str:
         """
-        Получает сырой текст всей истории переписки из всех ячеек 'текст_обращений' для данного пользователя.
+        Получает сырой текст истории переписки из ячейки 'текст_обращений' пользователя.
+        
+        У пользователя одна строка (create_appeal дописывает в найденную),
+        поэтому читается только ее ячейка E.
         
         Args:
             telegram_id: ID пользователя в Telegram
             
         Returns:
-            str: склеенный текст или пустая строка
+            str: текст истории или пустая строка
         """
         if not self.is_available():
             return ""
 
         try:
-            records = await self.gateway.get_all_records(self.worksheet)
-            all_history = []
-            
-            for i, record in enumerate(records, start=2):
-                if str(record.get('telegram_id', '')) == str(telegram_id):
-                    history = record.get('текст_обращений', '')
-                    if history.strip():
-                        all_history.append(history)
-            
-            if not all_history:
+            _, combined = await self._row_history(telegram_id)
+            if not combined.strip():
                 return ""
             
-            # Склеиваем историю от новых к старым
-            combined = "\n\n--- СЛЕДУЮЩИЙ БЛОК ИСТОРИИ ---\n\n".join(all_history)
-            
             # ОГРАНИЧЕНИЕ: Берем только последние 5000 символов для экономии токенов и ускорения
             if len(combined) > 5000:
                 combined = "[...] " + combined[-5000:]
                 
-            logger.info(f"Получена история для {mask_telegram_id(telegram_id)} (длина: {len(combined)})")
+            logger.debug("Получена история для %s (длина: %d)", mask_telegram_id(telegram_id), len(combined))
             return combined
             
         except Exception as e:
@@ -260,13 +745,12 @@ class AppealsService:
             return ""
 
         try:
-            records = await self.gateway.get_all_records(self.worksheet)
-            
-            for record in records:
-                if str(record.get('telegram_id', '')) == str(telegram_id):
-                    # Колонка I — 9-я по счету. В словаре record ключи по заголовкам.
-                    # Если заголовка еще нет, record.get() вернет None.
-                    return str(record.get('контекст_памяти', '')).strip()
+            records, index = await self._snapshot()
+            row = index.get(str(telegram_id))
+            if row:
+                # Колонка I — 9-я по счету. В словаре record ключи по заголовкам.
+                # Если заголовка еще нет, record.get() вернет None.
+                return str(records[row - 2].get('контекст_памяти', '')).strip()
             
             return ""
         except Exception as e:
@@ -288,21 +772,13 @@ class AppealsService:
             return False
 
         try:
-            records = await self.gateway.get_all_records(self.worksheet)
-            existing_row = None
-            
-            for i, record in enumerate(records, start=2):
-                if str(record.get('telegram_id', '')) == str(telegram_id):
-                    existing_row = i
-                    break
+            index = await self._row_index()
+            existing_row = index.get(str(telegram_id))
             
             if existing_row:
                 # Обновляем колонку I (9)
                 truncated_memory = self._truncate_to_gs_limit(memory_text, limit=5000)
-                await self.gateway.batch_update(self.worksheet, [{
-                    'range': f'I{existing_row}',
-                    'values': [[truncated_memory]]
-                }])
+                await self._stage(existing_row, {'I': truncated_memory})
                 logger.info(f"Обновлена долгосрочная память для пользователя {mask_telegram_id(telegram_id)}")
                 return True
             return False
@@ -328,18 +804,24 @@ class AppealsService:
             return False
 
         try:
-            records = await self.gateway.get_all_records(self.worksheet)
-            timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            records, index = await self._snapshot()
+            timestamp = _ts()
+            tid_str = str(telegram_id)
             
-            for i, record in enumerate(records, start=2):  # start=2 потому что строка 1 - заголовки
-                if (str(record.get('telegram_id', '')) == str(telegram_id) and 
+            # Строки выше первой строки пользователя (по индексу) его обращений
+            # не содержат; нет в индексе - нечего и перебирать
+            first_row = index.get(tid_str)
+            candidates = enumerate(records[first_row - 2:], start=first_row) if first_row else ()
+            for i, record in candidates:
+                if (str(record.get('telegram_id', '')) == tid_str and 
                     record.get('текст_обращений', '') == appeal_text):
                     
-                    # Обновляем статус и ответ специалиста
-                    await self.gateway.update(self.worksheet, f'F{i}', [[status]])  # статус
+                    # Обновляем статус, ответ специалиста и время;
+                    # пустой ответ не затирает уже записанный в G
+                    cells = {'F': status, 'H': timestamp}
                     if specialist_answer:
-                        await self.gateway.update(self.worksheet, f'G{i}', [[specialist_answer]])  # специалист_ответ
-                    await self.gateway.update(self.worksheet, f'H{i}', [[timestamp]])  # время_обновления
+                        cells['G'] = specialist_answer
+                    await self._stage(i, cells)
                     
                     logger.info(f"Обновлен статус обращения для пользователя {mask_telegram_id(telegram_id)}")
                     return True
@@ -366,14 +848,15 @@ class AppealsService:
             return []
 
         try:
-            records = await self.gateway.get_all_records(self.worksheet)
+            records, _ = await self._snapshot()
             
             if status:
-                filtered_records = [r for r in records if r.get('статус', '').lower() == status.lower()]
+                status_lower = status.lower()
+                filtered_records = [r for r in records if r.get('статус', '').lower() == status_lower]
                 logger.info(f"Найдено {len(filtered_records)} обращений со статусом '{status}'")
                 return filtered_records
             else:
-                logger.info(f"Найдено {len(records)} обращений всего")
+                logger.debug("Найдено %d обращений всего", len(records))
                 return records
                 
         except Exception as e:
@@ -392,24 +875,39 @@ class AppealsService:
             return []
 
         try:
-            records = await self.gateway.get_all_records(self.worksheet)
+            # При опросе читаем только telegram_id (D) и ответ (G)
+            columns = await self._fetch_columns(['D', 'G'])
+            telegram_ids, answers = columns['D'], columns['G']
             responses_to_send = []
             
-            for i, record in enumerate(records, start=2):  # start=2 потому что строка 1 - заголовки
-                specialist_answer = record.get('специалист_ответ', '').strip()
-                telegram_id = record.get('telegram_id', '')
+            for i, answer in enumerate(answers):
+                specialist_answer = str(answer).strip()
+                telegram_id = telegram_ids[i] if i < len(telegram_ids) else ''
                 
                 if specialist_answer and telegram_id:
                     responses_to_send.append({
-                        'row': i,
+                        'row': i + 2,  # +2 потому что строка 1 - заголовки
                         'telegram_id': int(telegram_id),
                         'response': specialist_answer,
-                        'code': record.get('код', ''),
-                        'fio': record.get('ФИО', '')
+                        'code': '',
+                        'fio': ''
                     })
             
             if responses_to_send:
                 logger.info(f"Найдено {len(responses_to_send)} ответов для отправки")
+                # Код (A) и ФИО (C) дочитываем только для найденных строк, одним batchGet
+                try:
+                    rows = await self.gateway.batch_get(
+                        self.worksheet, [f"A{r['row']}:C{r['row']}" for r in responses_to_send]
+                    )
+                    for response, values in zip(responses_to_send, rows):
+                        cells = values[0] if values else []
+                        response['code'] = cells[0] if len(cells) > 0 else ''
+                        response['fio'] = cells[2] if len(cells) > 2 else ''
+                except CircuitBreakerOpenError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Не удалось получить код/ФИО для ответов: {e}")
             
             return responses_to_send
             
@@ -429,26 +927,21 @@ class AppealsService:
             return []
 
         try:
-            records = await self.gateway.get_all_records(self.worksheet)
+            # Только telegram_id (D), текст обращений (E) и статус (F)
+            columns = await self._fetch_columns(['D', 'E', 'F'])
+            telegram_ids, texts, statuses = columns['D'], columns['E'], columns['F']
             resolved_appeals = []
             
-            for i, record in enumerate(records, start=2):
-                status = str(record.get('статус', '')).strip().lower()
-                appeals_text = str(record.get('текст_обращений', ''))
-                telegram_id = record.get('telegram_id', '')
+            for i, status in enumerate(statuses, start=2):
+                status = str(status).strip().lower()
+                appeals_text = str(texts[i - 2]) if i - 2 < len(texts) else ''
+                telegram_id = telegram_ids[i - 2] if i - 2 < len(telegram_ids) else ''
                 
                 # Если статус "решено" и в тексте нет маркера закрытия
                 if status == 'решено' and telegram_id:
-                    # Маркеры, которые мы добавляем при закрытии (проверяем оба варианта)
-                    closing_markers = [
-                        "✅ Ваше обращение решено",
-                        "✅ Ваше обращение отмечено как решенное специалистом."
-                    ]
-                    
-                    # Проверяем, есть ли хотя бы один маркер
-                    has_marker = any(marker in appeals_text for marker in closing_markers)
-                    
-                    if not has_marker:
+                    # Маркер может быть не первой строкой: пользователь пишет и
+                    # после закрытия, поэтому ищем по всему тексту
+                    if not _CLOSED_MARKER.search(appeals_text):
                         resolved_appeals.append({
                             'row': i,
                             'telegram_id': int(telegram_id),
@@ -479,11 +972,8 @@ class AppealsService:
             return False
 
         try:
-            # Очищаем колонку G (специалист_ответ) - используем batch_update
-            await self.gateway.batch_update(self.worksheet, [{
-                'range': f'G{row}',
-                'values': [['']]
-            }])
+            # Очищаем колонку G (специалист_ответ)
+            await self._stage(row, {'G': ''})
             logger.info(f"Очищен ответ специалиста в строке {row}")
             return True
             
@@ -501,9 +991,17 @@ class AppealsService:
         if not self.is_available():
             return False
 
+        if self._has_records:
+            return True
+
         try:
-            records = await self.gateway.get_all_records(self.worksheet)
-            return len(records) > 0
+            # Сначала то, что уже есть в памяти, иначе — одна ячейка D2
+            if self._index or self._row_idx:
+                self._has_records = True
+            else:
+                cell = await self.gateway.cell(self.worksheet, 2, 4)
+                self._has_records = bool(cell.value)
+            return self._has_records
         except Exception as e:
             logger.error(f"Ошибка проверки наличия записей: {e}")
             return False
@@ -524,19 +1022,10 @@ class AppealsService:
             return False
 
         try:
-            # Ищем существующую строку для этого telegram_id
-            records = await self.gateway.get_all_records(self.worksheet)
-            existing_row = None
-            
-            for i, record in enumerate(records, start=2):  # start=2 потому что строка 1 - заголовки
-                if str(record.get('telegram_id', '')) == str(telegram_id):
-                    existing_row = i
-                    break
+            # Ищем существующую строку для этого telegram_id и ее обращения (колонка E)
+            existing_row, current_appeals = await self._row_history(telegram_id)
             
             if existing_row:
-                # Получаем текущие обращения
-                cell = await self.gateway.cell(self.worksheet, existing_row, 5)
-                current_appeals = cell.value or ""  # колонка E
                 
                 # Добавляем ответ специалиста сверху
                 if current_appeals.strip():
@@ -547,10 +1036,7 @@ class AppealsService:
                 updated_appeals = self._truncate_to_gs_limit(updated_appeals)
                 
                 # Обновляем ячейку с обращениями
-                await self.gateway.batch_update(self.worksheet, [{
-                    'range': f'E{existing_row}',
-                    'values': [[updated_appeals]]
-                }])
+                await self._stage(existing_row, {'E': updated_appeals})
                 
                 logger.info(f"Ответ специалиста добавлен для пользователя {mask_telegram_id(telegram_id)} (строка {existing_row})")
                 return True
@@ -578,19 +1064,10 @@ class AppealsService:
             return False
 
         try:
-            # Ищем существующую строку для этого telegram_id
-            records = await self.gateway.get_all_records(self.worksheet)
-            existing_row = None
-            
-            for i, record in enumerate(records, start=2):  # start=2 потому что строка 1 - заголовки
-                if str(record.get('telegram_id', '')) == str(telegram_id):
-                    existing_row = i
-                    break
+            # Ищем существующую строку для этого telegram_id и ее обращения (колонка E)
+            existing_row, current_appeals = await self._row_history(telegram_id)
             
             if existing_row:
-                # Получаем текущие обращения
-                cell = await self.gateway.cell(self.worksheet, existing_row, 5)
-                current_appeals = cell.value or ""  # колонка E
                 
                 # Добавляем ответ ИИ сверху с префиксом
                 ai_response = f"🤖 ИИ: {response_text}"
@@ -602,30 +1079,9 @@ class AppealsService:
                 updated_appeals = self._truncate_to_gs_limit(updated_appeals)
                 
                 # Обновляем ячейку с обращениями и статус
-                await self.gateway.batch_update(self.worksheet, [{
-                    'range': f'E{existing_row}',
-                    'values': [[updated_appeals]]
-                }, {
-                    'range': f'F{existing_row}',
-                    'values': [['Ответ ИИ']]
-                }])
+                await self._stage(existing_row, {'E': updated_appeals, 'F': 'Ответ ИИ'})
                 
-                logger.info(f"Статус обновлен на 'Ответ ИИ' для строки {existing_row}")
-                
-                # Устанавливаем заливку #ffffff (белый) для статуса "Ответ ИИ"
-                try:
-                    logger.info(f"Попытка установить заливку для ячейки F{existing_row}")
-                    await self.gateway.format(self.worksheet, f'F{existing_row}', {
-                        "backgroundColor": {
-                            "red": 1.0,    # #ffffff
-                            "green": 1.0,
-                            "blue": 1.0
-                        }
-                    })
-                    logger.info(f"Заливка успешно установлена для ячейки F{existing_row}")
-                except Exception as format_error:
-                    logger.error(f"Ошибка при установке заливки для ячейки F{existing_row}: {format_error}", exc_info=True)
-                    # Продолжаем выполнение, даже если форматирование не удалось
+                logger.debug("Статус обновлен на 'Ответ ИИ' для строки %s", existing_row)
                 
                 logger.info(f"Ответ ИИ добавлен для пользователя {mask_telegram_id(telegram_id)} (строка {existing_row})")
                 return True
@@ -647,25 +1103,15 @@ class AppealsService:
             return False
 
         try:
-            records = await self.gateway.get_all_records(self.worksheet)
-            existing_row = None
-            for i, record in enumerate(records, start=2):
-                if str(record.get('telegram_id', '')) == str(telegram_id):
-                    existing_row = i
-                    break
+            existing_row, current_appeals = await self._row_history(telegram_id)
 
             if existing_row:
-                cell = await self.gateway.cell(self.worksheet, existing_row, 5)
-                current_appeals = cell.value or ""
-                timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                timestamp = _ts()
                 user_line = f"{timestamp}: Пользователь: {message_text}"
                 updated_appeals = f"{user_line}\n{current_appeals}" if current_appeals.strip() else user_line
                 # Усечение под лимит Google Sheets
                 updated_appeals = self._truncate_to_gs_limit(updated_appeals)
-                await self.gateway.batch_update(self.worksheet, [
-                    {'range': f'E{existing_row}', 'values': [[updated_appeals]]},
-                    {'range': f'H{existing_row}', 'values': [[timestamp]]}
-                ])
+                await self._stage(existing_row, {'E': updated_appeals, 'H': timestamp})
                 logger.info(f"Сообщение пользователя добавлено (страховка) для {mask_telegram_id(telegram_id)} (строка {existing_row})")
                 return True
             else:
@@ -691,36 +1137,14 @@ class AppealsService:
 
         try:
             # Ищем существующую строку для этого telegram_id
-            records = await self.gateway.get_all_records(self.worksheet)
-            existing_row = None
-            
-            for i, record in enumerate(records, start=2):  # start=2 потому что строка 1 - заголовки
-                if str(record.get('telegram_id', '')) == str(telegram_id):
-                    existing_row = i
-                    break
+            index = await self._row_index()
+            existing_row = index.get(str(telegram_id))
             
             if existing_row:
-                # Устанавливаем статус "Передано специалисту" в колонке F (статус)
-                await self.gateway.batch_update(self.worksheet, [{
-                    'range': f'F{existing_row}',
-                    'values': [['Передано специалисту']]
-                }])
+                # Устанавливаем статус "Передано специалисту" в колонке F (заливку задает условное форматирование)
+                await self._stage(existing_row, {'F': 'Передано специалисту'})
                 
-                logger.info(f"Статус обновлен на 'Передано специалисту' для строки {existing_row}")
-                
-                # Устанавливаем заливку #f3cccc (светло-красный) для колонки F
-                try:
-                    logger.info(f"Попытка установить заливку #f3cccc для ячейки F{existing_row}")
-                    await self.gateway.format(self.worksheet, f'F{existing_row}', {
-                        "backgroundColor": {
-                            "red": 0.95,    # #f3cccc
-                            "green": 0.8,
-                            "blue": 0.8
-                        }
-                    })
-                    logger.info(f"Заливка успешно установлена для ячейки F{existing_row}")
-                except Exception as format_error:
-                    logger.error(f"Ошибка при установке заливки для ячейки F{existing_row}: {format_error}", exc_info=True)
+                logger.debug("Статус обновлен на 'Передано специалисту' для строки %s", existing_row)
                 
                 logger.info(f"Статус установлен 'Передано специалисту' для пользователя {mask_telegram_id(telegram_id)} (строка {existing_row})")
                 return True
@@ -748,36 +1172,14 @@ class AppealsService:
 
         try:
             # Ищем существующую строку для этого telegram_id
-            records = await self.gateway.get_all_records(self.worksheet)
-            existing_row = None
-            
-            for i, record in enumerate(records, start=2):  # start=2 потому что строка 1 - заголовки
-                if str(record.get('telegram_id', '')) == str(telegram_id):
-                    existing_row = i
-                    break
+            index = await self._row_index()
+            existing_row = index.get(str(telegram_id))
             
             if existing_row:
-                # Устанавливаем статус "В работе" в колонке F (статус)
-                await self.gateway.batch_update(self.worksheet, [{
-                    'range': f'F{existing_row}',
-                    'values': [['В работе']]
-                }])
-                
-                logger.info(f"Статус обновлен на 'В работе' для строки {existing_row}")
+                # Устанавливаем статус "В работе" в колонке F (заливку задает условное форматирование)
+                await self._stage(existing_row, {'F': 'В работе'})
                 
-                # Устанавливаем заливку #fff2cc (светло-желтый) для колонки F
-                try:
-                    logger.info(f"Попытка установить заливку #fff2cc для ячейки F{existing_row}")
-                    await self.gateway.format(self.worksheet, f'F{existing_row}', {
-                        "backgroundColor": {
-                            "red": 1.0,    # #fff2cc
-                            "green": 0.95,
-                            "blue": 0.8
-                        }
-                    })
-                    logger.info(f"Заливка успешно установлена для ячейки F{existing_row}")
-                except Exception as format_error:
-                    logger.error(f"Ошибка при установке заливки для ячейки F{existing_row}: {format_error}", exc_info=True)
+                logger.debug("Статус обновлен на 'В работе' для строки %s", existing_row)
                 
                 logger.info(f"Статус установлен 'В работе' для пользователя {mask_telegram_id(telegram_id)} (строка {existing_row})")
                 return True
@@ -805,36 +1207,14 @@ class AppealsService:
 
         try:
             # Ищем существующую строку для этого telegram_id
-            records = await self.gateway.get_all_records(self.worksheet)
-            existing_row = None
-            
-            for i, record in enumerate(records, start=2):
-                if str(record.get('telegram_id', '')) == str(telegram_id):
-                    existing_row = i
-                    break
+            index = await self._row_index()
+            existing_row = index.get(str(telegram_id))
             
             if existing_row:
-                # Устанавливаем статус "Решено" в колонке F (статус)
-                await self.gateway.batch_update(self.worksheet, [{
-                    'range': f'F{existing_row}',
-                    'values': [['Решено']]
-                }])
+                # Устанавливаем статус "Решено" в колонке F (заливку задает условное форматирование)
+                await self._stage(existing_row, {'F': 'Решено'})
                 
-                logger.info(f"Статус обновлен на 'Решено' для строки {existing_row}")
-                
-                # Зелёная заливка #d9ead3
-                try:
-                    logger.info(f"Попытка установить заливку #d9ead3 для ячейки F{existing_row}")
-                    await self.gateway.format(self.worksheet, f'F{existing_row}', {
-                        "backgroundColor": {
-                            "red": 0.85,
-                            "green": 0.92,
-                            "blue": 0.83
-                        }
-                    })
-                    logger.info(f"Заливка успешно установлена для ячейки F{existing_row}")
-                except Exception as format_error:
-                    logger.error(f"Ошибка при установке заливки для ячейки F{existing_row}: {format_error}", exc_info=True)
+                logger.debug("Статус обновлен на 'Решено' для строки %s", existing_row)
                 
                 logger.info(f"Статус установлен 'Решено' для пользователя {mask_telegram_id(telegram_id)} (строка {existing_row})")
                 return True
@@ -861,41 +1241,26 @@ class AppealsService:
             return 'новое'
 
         try:
-            # Ищем существующую строку для этого telegram_id
-            records = await self.gateway.get_all_records(self.worksheet)
-            
-            for i, record in enumerate(records, start=2):
-                if str(record.get('telegram_id', '')) == str(telegram_id):
-                    status = record.get('статус', 'новое')
-                    logger.info(f"Найден статус для пользователя {mask_telegram_id(telegram_id)}: {status}")
-                    # Авто-форматирование: применяем заливку в зависимости от статуса
-                    try:
-                        status_lower = str(status).strip().lower()
-                        if status_lower == 'решено':
-                            logger.info(f"Попытка установить заливку #d9ead3 для ячейки F{i} (статус: решено)")
-                            await self.gateway.format(self.worksheet, f'F{i}', {
-                                "backgroundColor": {
-                                    "red": 0.85,
-                                    "green": 0.92,
-                                    "blue": 0.83
-                                }
-                            })
-                            logger.info(f"Заливка успешно установлена для ячейки F{i}")
-                        elif status_lower == 'в работе':
-                            logger.info(f"Попытка установить заливку #fff2cc для ячейки F{i} (статус: в работе)")
-                            await self.gateway.format(self.worksheet, f'F{i}', {
-                                "backgroundColor": {
-                                    "red": 1.0,
-                                    "green": 0.95,
-                                    "blue": 0.8
-                                }
-                            })
-                            logger.info(f"Заливка успешно установлена для ячейки F{i}")
-                    except Exception as e:
-                        logger.error(f"Не удалось применить форматирование для строки {i}: {e}", exc_info=True)
-                    return status
-            
-            logger.info(f"Статус для пользователя {mask_telegram_id(telegram_id)} не найден, возвращаем 'новое'")
+            # Ищем строку по индексу; при свежем снимке статус берем из него,
+            # иначе читаем одну ячейку F этой строки
+            tid_str = str(telegram_id)
+            if self._snapshot_is_fresh():
+                i = self._index.get(tid_str)
+                status = self._records[i - 2].get('статус', 'новое') if i else None
+            else:
+                i = (await self._row_index()).get(tid_str)
+                status = None
+                if i:
+                    seq = self._write_seq
+                    status = self._edits_since(seq).get(i, {}).get('F')
+                    if status is None:
+                        cell = await self.gateway.cell(self.worksheet, i, _STATUS_COL)
+                        status = self._edits_since(seq).get(i, {}).get('F', cell.value or '')
+            if i:
+                logger.debug("Найден статус для пользователя %s: %s", mask_telegram_id(telegram_id), status)
+                return status
+            
+            logger.debug("Статус для пользователя %s не найден, возвращаем 'новое'", mask_telegram_id(telegram_id))
             return 'новое'
                 
         except Exception as e:
@@ -4,17 +4,27 @@ FastAPI приложение для REST API.
 """
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from api.routers import appeals
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# orjson (если установлен) сериализует списки обращений с datetime
+# заметно быстрее стандартного json
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:
+    DefaultResponse = JSONResponse
+
 # Создаем FastAPI приложение
 app = FastAPI(
     title="MarketingBot API",
     description="REST API для работы с обращениями и админ-панелью",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=DefaultResponse,
 )
 
 # Настройка CORS для админ-панели
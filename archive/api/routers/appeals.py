@@ -2,12 +2,13 @@
 API endpoints для работы с обращениями.
 """
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.orm import Session, load_only
 from typing import List, Optional
 from db.database import get_db
 from db.models import Appeal, AppealMessage, SpecialistResponse
 from api.schemas import (
-    AppealCreate, AppealResponse, AppealUpdate,
+    AppealCreate, AppealResponse, AppealUpdate, AppealFullResponse,
     MessageCreate, MessageResponse,
     SpecialistResponseCreate, SpecialistResponseResponse
 )
@@ -20,6 +21,8 @@ router = APIRouter()
 def get_appeals(
     status: Optional[str] = Query(None, description="Фильтр по статусу"),
     telegram_id: Optional[int] = Query(None, description="Фильтр по Telegram ID"),
+    before: Optional[datetime] = Query(None, description="Курсор: created_at последнего обращения предыдущей страницы"),
+    before_id: Optional[int] = Query(None, description="Курсор: id последнего обращения предыдущей страницы"),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     db: Session = Depends(get_db)
@@ -29,18 +32,34 @@ def get_appeals(
     
     - **status**: Фильтр по статусу (новое, в_работе, передано_специалисту, ответ_ии, решено)
     - **telegram_id**: Фильтр по Telegram ID пользователя
+    - **before**, **before_id**: Keyset-пагинация — created_at и id последнего обращения
+      предыдущей страницы (быстрее, чем skip на больших таблицах); id различает
+      обращения с одинаковым created_at
     - **skip**: Количество записей для пропуска (пагинация)
     - **limit**: Максимальное количество записей (до 1000)
     """
-    query = db.query(Appeal)
+    # AppealResponse не сериализует связи (messages/responses), поэтому грузим
+    # только нужные колонки и не трогаем relationship-атрибуты (без N+1).
+    query = db.query(Appeal).options(load_only(
+        Appeal.id, Appeal.partner_code, Appeal.phone, Appeal.fio,
+        Appeal.telegram_id, Appeal.status, Appeal.created_at, Appeal.updated_at
+    ))
     
     if status:
         query = query.filter(Appeal.status == status)
     if telegram_id:
         query = query.filter(Appeal.telegram_id == telegram_id)
+    if before:
+        if before_id is not None:
+            query = query.filter(or_(
+                Appeal.created_at < before,
+                and_(Appeal.created_at == before, Appeal.id < before_id),
+            ))
+        else:
+            query = query.filter(Appeal.created_at < before)
     
-    # Сортировка по дате создания (новые сначала)
-    query = query.order_by(Appeal.created_at.desc())
+    # Сортировка по дате создания (новые сначала), id — для стабильного порядка
+    query = query.order_by(Appeal.created_at.desc(), Appeal.id.desc())
     
     appeals = query.offset(skip).limit(limit).all()
     return appeals
@@ -51,12 +70,38 @@ def get_appeal(appeal_id: int, db: Session = Depends(get_db)):
     """
     Получить детали обращения по ID.
     """
-    appeal = db.query(Appeal).filter(Appeal.id == appeal_id).first()
+    appeal = db.get(Appeal, appeal_id)
     if not appeal:
         raise HTTPException(status_code=404, detail="Обращение не найдено")
     return appeal
 
 
+@router.get("/{appeal_id}/full", response_model=AppealFullResponse)
+def get_appeal_full(appeal_id: int, db: Session = Depends(get_db)):
+    """
+    Получить обращение вместе с сообщениями и ответами специалистов.
+    
+    Заменяет три запроса админ-панели (обращение, сообщения, ответы) одним.
+    """
+    appeal = db.get(Appeal, appeal_id)
+    if not appeal:
+        raise HTTPException(status_code=404, detail="Обращение не найдено")
+    
+    messages = db.query(AppealMessage).filter(
+        AppealMessage.appeal_id == appeal_id
+    ).order_by(AppealMessage.created_at.asc()).all()
+    
+    responses = db.query(SpecialistResponse).filter(
+        SpecialistResponse.appeal_id == appeal_id
+    ).order_by(SpecialistResponse.sent_at.desc()).all()
+    
+    return AppealFullResponse(
+        **AppealResponse.model_validate(appeal).model_dump(),
+        messages=messages,
+        responses=responses
+    )
+
+
 @router.post("/", response_model=AppealResponse)
 def create_appeal(appeal: AppealCreate, db: Session = Depends(get_db)):
     """
@@ -78,7 +123,7 @@ def update_appeal(
     """
     Обновить обращение.
     """
-    appeal = db.query(Appeal).filter(Appeal.id == appeal_id).first()
+    appeal = db.get(Appeal, appeal_id)
     if not appeal:
         raise HTTPException(status_code=404, detail="Обращение не найдено")
     
@@ -87,7 +132,7 @@ def update_appeal(
     for field, value in update_data.items():
         setattr(appeal, field, value)
     
-    appeal.updated_at = datetime.utcnow()
+    appeal.updated_at = func.now()
     db.commit()
     db.refresh(appeal)
     return appeal
@@ -102,12 +147,18 @@ def update_status(
     """
     Изменить статус обращения.
     """
-    appeal = db.query(Appeal).filter(Appeal.id == appeal_id).first()
-    if not appeal:
+    # Один UPDATE без загрузки ORM-объекта; rowcount вместо RETURNING,
+    # чтобы работать и на старых версиях SQLite
+    result = db.execute(
+        update(Appeal)
+        .where(Appeal.id == appeal_id)
+        .values(status=status, updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.rollback()
         raise HTTPException(status_code=404, detail="Обращение не найдено")
     
-    appeal.status = status
-    appeal.updated_at = datetime.utcnow()
     db.commit()
     return {"message": "Статус обновлен", "status": status}
 
@@ -119,7 +170,7 @@ def get_appeal_messages(appeal_id: int, db: Session = Depends(get_db)):
     """
     Получить все сообщения обращения.
     """
-    appeal = db.query(Appeal).filter(Appeal.id == appeal_id).first()
+    appeal = db.get(Appeal, appeal_id)
     if not appeal:
         raise HTTPException(status_code=404, detail="Обращение не найдено")
     
@@ -139,7 +190,7 @@ def add_message(
     """
     Добавить сообщение в обращение.
     """
-    appeal = db.query(Appeal).filter(Appeal.id == appeal_id).first()
+    appeal = db.get(Appeal, appeal_id)
     if not appeal:
         raise HTTPException(status_code=404, detail="Обращение не найдено")
     
@@ -149,8 +200,8 @@ def add_message(
     )
     db.add(db_message)
     
-    # Обновляем время обновления обращения
-    appeal.updated_at = datetime.utcnow()
+    # Обновляем время обновления обращения (NOW() на стороне БД)
+    appeal.updated_at = func.now()
     
     db.commit()
     db.refresh(db_message)
@@ -168,7 +219,7 @@ def add_specialist_response(
     """
     Добавить ответ специалиста к обращению.
     """
-    appeal = db.query(Appeal).filter(Appeal.id == appeal_id).first()
+    appeal = db.get(Appeal, appeal_id)
     if not appeal:
         raise HTTPException(status_code=404, detail="Обращение не найдено")
     
@@ -177,7 +228,6 @@ def add_specialist_response(
         appeal_id=appeal_id,
         **response.dict()
     )
-    db.add(db_response)
     
     # Добавляем сообщение в историю
     db_message = AppealMessage(
@@ -185,17 +235,20 @@ def add_specialist_response(
         message_type="specialist",
         message_text=f"👨‍💼 СПЕЦИАЛИСТ: {response.response_text}"
     )
-    db.add(db_message)
+    db.add_all([db_response, db_message])
     
     # Обновляем статус на "в_работе" если еще не установлен
     if appeal.status not in ["в_работе", "решено"]:
         appeal.status = "в_работе"
     
-    appeal.updated_at = datetime.utcnow()
+    appeal.updated_at = func.now()
     
+    # Один flush отправляет оба INSERT и UPDATE обращения; ответ сериализуем
+    # до commit, чтобы не перечитывать истёкший после commit объект (refresh).
+    db.flush()
+    result = SpecialistResponseResponse.model_validate(db_response)
     db.commit()
-    db.refresh(db_response)
-    return db_response
+    return result
 
 
 @router.get("/{appeal_id}/responses", response_model=List[SpecialistResponseResponse])
@@ -203,7 +256,7 @@ def get_appeal_responses(appeal_id: int, db: Session = Depends(get_db)):
     """
     Получить все ответы специалистов по обращению.
     """
-    appeal = db.query(Appeal).filter(Appeal.id == appeal_id).first()
+    appeal = db.get(Appeal, appeal_id)
     if not appeal:
         raise HTTPException(status_code=404, detail="Обращение не найдено")
     
@@ -2,7 +2,7 @@
 Pydantic схемы для валидации данных API.
 """
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -83,6 +83,14 @@ class SpecialistResponseResponse(BaseModel):
         from_attributes = True
 
 
+# ========== Full appeal (Обращение целиком) ==========
+
+class AppealFullResponse(AppealResponse):
+    """Схема ответа с обращением, сообщениями и ответами специалистов"""
+    messages: List[MessageResponse] = []
+    responses: List[SpecialistResponseResponse] = []
+
+
 # ========== Auth (Авторизация) ==========
 
 class AdminLogin(BaseModel):
@@ -6,11 +6,21 @@
 import logging
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from db.models import Appeal, AppealMessage, SpecialistResponse
 
 logger = logging.getLogger(__name__)
 
+# Проверка подключения: текстовый запрос собирается один раз
+_PING = text("SELECT 1")
+
+# Колонки словаря обращения: выбираются кортежами, без ORM-объектов
+_APPEAL_COLUMNS = (
+    Appeal.id, Appeal.telegram_id, Appeal.partner_code, Appeal.phone,
+    Appeal.fio, Appeal.status, Appeal.created_at, Appeal.updated_at
+)
+
 
 class AppealsServiceDB:
     """
@@ -31,7 +41,7 @@ class AppealsServiceDB:
         """Проверяет доступность сервиса обращений."""
         try:
             # Простая проверка подключения
-            self.db.execute("SELECT 1")
+            self.db.execute(_PING).scalar()
             return True
         except Exception as e:
             logger.error(f"Сервис обращений недоступен: {e}")
@@ -103,16 +113,14 @@ class AppealsServiceDB:
         """Очищает сообщения старше 30 дней."""
         try:
             cutoff_date = datetime.utcnow() - timedelta(days=30)
-            old_messages = self.db.query(AppealMessage).filter(
+            # Один DELETE ... WHERE без загрузки объектов в сессию
+            deleted = self.db.query(AppealMessage).filter(
                 AppealMessage.appeal_id == appeal_id,
                 AppealMessage.created_at < cutoff_date
-            ).all()
-            
-            for msg in old_messages:
-                self.db.delete(msg)
+            ).delete(synchronize_session=False)
             
-            if old_messages:
-                logger.info(f"Удалено {len(old_messages)} старых сообщений для обращения {appeal_id}")
+            if deleted:
+                logger.info(f"Удалено {deleted} старых сообщений для обращения {appeal_id}")
         except Exception as e:
             logger.error(f"Ошибка очистки старых сообщений: {e}")
     
@@ -415,22 +423,9 @@ class AppealsServiceDB:
             List[Dict]: список обращений пользователя
         """
         try:
-            appeals = self.db.query(Appeal).filter(
+            result = self._appeal_dicts(self.db.query(*_APPEAL_COLUMNS).filter(
                 Appeal.telegram_id == telegram_id
-            ).all()
-            
-            result = []
-            for appeal in appeals:
-                result.append({
-                    'id': appeal.id,
-                    'telegram_id': appeal.telegram_id,
-                    'partner_code': appeal.partner_code,
-                    'phone': appeal.phone,
-                    'fio': appeal.fio,
-                    'status': appeal.status,
-                    'created_at': appeal.created_at.isoformat() if appeal.created_at else None,
-                    'updated_at': appeal.updated_at.isoformat() if appeal.updated_at else None
-                })
+            ))
             
             logger.info(f"Найдено {len(result)} обращений для пользователя {telegram_id}")
             return result
@@ -450,25 +445,12 @@ class AppealsServiceDB:
             List[Dict]: список всех обращений
         """
         try:
-            query = self.db.query(Appeal)
+            query = self.db.query(*_APPEAL_COLUMNS)
             
             if status:
                 query = query.filter(Appeal.status == status)
             
-            appeals = query.all()
-            
-            result = []
-            for appeal in appeals:
-                result.append({
-                    'id': appeal.id,
-                    'telegram_id': appeal.telegram_id,
-                    'partner_code': appeal.partner_code,
-                    'phone': appeal.phone,
-                    'fio': appeal.fio,
-                    'status': appeal.status,
-                    'created_at': appeal.created_at.isoformat() if appeal.created_at else None,
-                    'updated_at': appeal.updated_at.isoformat() if appeal.updated_at else None
-                })
+            result = self._appeal_dicts(query)
             
             logger.info(f"Найдено {len(result)} обращений" + (f" со статусом '{status}'" if status else ""))
             return result
@@ -477,6 +459,21 @@ class AppealsServiceDB:
             logger.error(f"Ошибка получения всех обращений: {e}")
             return []
     
+    @staticmethod
+    def _appeal_dicts(query) -> List[Dict]:
+        """Собирает словари обращений из запроса по _APPEAL_COLUMNS, читая строки порциями."""
+        return [{
+            'id': appeal_id,
+            'telegram_id': telegram_id,
+            'partner_code': partner_code,
+            'phone': phone,
+            'fio': fio,
+            'status': status,
+            'created_at': created_at.isoformat() if created_at else None,
+            'updated_at': updated_at.isoformat() if updated_at else None
+        } for appeal_id, telegram_id, partner_code, phone, fio, status, created_at, updated_at
+            in query.yield_per(1000)]
+    
     def check_for_resolved_status(self) -> List[Dict]:
         """
         Проверяет наличие обращений со статусом 'Решено', о которых еще не уведомлен пользователь.
@@ -486,23 +483,23 @@ class AppealsServiceDB:
             List[Dict]: список решенных обращений для уведомления
         """
         try:
-            appeals = self.db.query(Appeal).filter(
-                Appeal.status == 'решено'
+            # Текст последнего сообщения обращения - коррелированный подзапрос,
+            # поэтому все проверяется одним запросом, а не запросом на обращение
+            last_message_text = self.db.query(AppealMessage.message_text).filter(
+                AppealMessage.appeal_id == Appeal.id
+            ).order_by(AppealMessage.created_at.desc()).limit(1).correlate(Appeal).scalar_subquery()
+            
+            # Обращения без сообщений (подзапрос дает NULL) отсеиваются, как и раньше
+            rows = self.db.query(Appeal.id, Appeal.telegram_id).filter(
+                Appeal.status == 'решено',
+                ~last_message_text.contains("✅ Ваше обращение решено")
             ).all()
             
-            resolved_appeals = []
-            for appeal in appeals:
-                # Проверяем, есть ли маркер закрытия в последних сообщениях
-                last_message = self.db.query(AppealMessage).filter(
-                    AppealMessage.appeal_id == appeal.id
-                ).order_by(AppealMessage.created_at.desc()).first()
-                
-                if last_message and "✅ Ваше обращение решено" not in last_message.message_text:
-                    resolved_appeals.append({
-                        'row': appeal.id,
-                        'telegram_id': appeal.telegram_id,
-                        'appeals_text': ''  # Не используется в БД
-                    })
+            resolved_appeals = [{
+                'row': appeal_id,
+                'telegram_id': telegram_id,
+                'appeals_text': ''  # Не используется в БД
+            } for appeal_id, telegram_id in rows]
             
             if resolved_appeals:
                 logger.info(f"Найдено {len(resolved_appeals)} решенных обращений для уведомления")
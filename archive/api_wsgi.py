@@ -17,18 +17,21 @@ os.environ.setdefault('DATABASE_URL', 'sqlite:///./db/appeals.db')
 os.chdir(path)
 
 try:
-    # Импортируем FastAPI приложение
+    # Импортируем FastAPI приложение. На ASGI-хостинге (uvicorn/hypercorn,
+    # ASGI-веб-приложения PythonAnywhere) указывайте api.main:app напрямую —
+    # адаптер ниже нужен только для классического WSGI.
     from api.main import app
     
-    # Используем ASGI-to-WSGI адаптер
-    from asgiref.wsgi import WsgiToAsgi
+    # ASGI-to-WSGI адаптер (asgiref.wsgi.WsgiToAsgi делает обратное
+    # преобразование и для FastAPI не подходит)
+    from a2wsgi import ASGIMiddleware
     
     # Обертываем FastAPI app в WSGI адаптер
-    application = WsgiToAsgi(app)
+    application = ASGIMiddleware(app)
     
 except ImportError:
     # Если адаптер не установлен, используем простой вариант
-    # Установите: pip3.10 install --user asgiref
+    # Установите: pip3.10 install --user a2wsgi
     def application(environ, start_response):
         start_response('500 Internal Server Error', [('Content-Type', 'text/plain')])
-        return [b'Error: asgiref not installed\nPlease install asgiref: pip3.10 install --user asgiref']
+        return [b'Error: a2wsgi not installed\nPlease install a2wsgi: pip3.10 install --user a2wsgi']
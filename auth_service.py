@@ -1,6 +1,8 @@
+import asyncio
 import logging
 import datetime
-from typing import Optional
+import time
+from typing import Dict, List, Optional, Tuple
 import os
 
 from cachetools import TTLCache
@@ -10,6 +12,17 @@ from utils import mask_phone, mask_telegram_id
 
 logger = logging.getLogger(__name__)
 
+# Буфер записей авторизации: пачка уходит одним batchUpdate при наборе
+# AUTH_WRITE_BATCH_SIZE строк или через AUTH_WRITE_BATCH_DELAY секунд
+_AUTH_WRITE_BATCH_SIZE = int(os.environ.get('AUTH_WRITE_BATCH_SIZE', '50'))
+_AUTH_WRITE_BATCH_DELAY = float(os.environ.get('AUTH_WRITE_BATCH_DELAY', '0.5'))
+
+# Индекс партнеров перестраивается при смене ревизии таблицы, но не реже раза в
+# AUTH_PARTNER_INDEX_TTL секунд; промах перечитывает колонки A/C не чаще раза в
+# AUTH_PARTNER_INDEX_MISS_REFRESH секунд (Drive обновляет modifiedTime с задержкой)
+_PARTNER_INDEX_TTL = float(os.environ.get('AUTH_PARTNER_INDEX_TTL', '600'))
+_PARTNER_INDEX_MISS_REFRESH = float(os.environ.get('AUTH_PARTNER_INDEX_MISS_REFRESH', '10'))
+
 
 
 
@@ -28,6 +41,18 @@ class AuthService:
         self.gateway = gateway or AsyncGoogleSheetsGateway(circuit_breaker_name='auth')
         self.auth_cache = TTLCache(maxsize=2000, ttl=300)
         
+        # Индекс (код партнера, нормализованный телефон) -> номер строки,
+        # действителен до изменения таблицы (ревизия = modifiedTime из Drive);
+        # собственные записи D:F ревизию индекса не сбрасывают
+        self._partner_index: Dict[Tuple[str, str], int] = {}
+        self._partner_index_revision: Optional[str] = None
+        self._partner_index_ts = 0.0
+        self._partner_index_lock = asyncio.Lock()
+        
+        # Отложенные записи D:F: (данные для batch_update, future вызывающего)
+        self._pending_writes: List[Tuple[Dict, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        
         # Синхронная инициализация для обратной совместимости
         try:
             _, worksheet = _get_client_and_sheet()
@@ -77,31 +102,19 @@ class AuthService:
             phone_norm = normalize_phone(partner_phone)
             logger.info(f"Нормализованный телефон из формы: '{mask_phone(phone_norm)}'")
             
-            # Получаем все записи через Gateway
-            records = await self.gateway.get_all_records(self.worksheet)
-            logger.info(f"Получено {len(records)} записей для поиска пользователя")
-            
-            row_index: Optional[int] = None
-            for i, record in enumerate(records, start=2):  # start=2 потому что строка 1 - заголовки
-                code_in_row = str(record.get('partner_code', record.get('Код партнера', ''))).strip()
-                phone_in_row = str(record.get('phone', record.get('Телефон партнера', ''))).strip()
-                normalized_row_phone = normalize_phone(phone_in_row)
-                
-                if code_in_row == partner_code and normalized_row_phone == phone_norm:
-                    row_index = i
-                    logger.info(f"Найдена строка с пользователем: {row_index}")
-                    break
+            row_index = await self._find_partner_row(partner_code, phone_norm)
 
             if row_index:
+                logger.info(f"Найдена строка с пользователем: {row_index}")
                 # Обновляем статус/telegram_id через Gateway
                 try:
                     timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                     # Обновляем статус (D), telegram_id (E), дату (F)
-                    await self.gateway.update(self.worksheet, f'D{row_index}:F{row_index}', [[
+                    await self._queue_auth_write(f'D{row_index}:F{row_index}', [
                         'authorized',
                         str(telegram_id),
                         timestamp
-                    ]])
+                    ])
                     logger.info(f"Пользователь с кодом {partner_code} успешно авторизован.")
                     
                     # Обновляем кэш
@@ -125,6 +138,131 @@ class AuthService:
             logger.error(f"Ошибка при поиске и обновлении пользователя: {e}")
             return False
 
+    async def _find_partner_row(self, partner_code: str, phone_norm: str) -> Optional[int]:
+        """
+        Ищет номер строки партнёра по коду и нормализованному телефону.
+        
+        Колонки A (Код партнера) и C (Телефон партнера) читаются одним batchGet
+        и один раз раскладываются в индекс; пока modifiedTime таблицы не
+        изменится, поиск — обращение к словарю. Промах перечитывает колонки:
+        новую строку партнера modifiedTime может еще не отражать.
+        """
+        try:
+            revision = await self.gateway.get_last_update_time(self.worksheet)
+        except CircuitBreakerOpenError:
+            raise
+        except Exception as e:
+            logger.debug(f"Не удалось получить ревизию таблицы авторизации: {e}")
+            revision = None
+        
+        key = (partner_code, phone_norm)
+        async with self._partner_index_lock:
+            age = time.monotonic() - self._partner_index_ts
+            if revision is None or revision != self._partner_index_revision or age >= _PARTNER_INDEX_TTL:
+                await self._load_partner_index(revision)
+                return self._partner_index.get(key)
+            row = self._partner_index.get(key)
+            if row is None and age >= _PARTNER_INDEX_MISS_REFRESH:
+                await self._load_partner_index(revision)
+                row = self._partner_index.get(key)
+            return row
+
+    async def _load_partner_index(self, revision: Optional[str]) -> None:
+        """Перечитывает колонки A и C и перестраивает индекс партнеров."""
+        codes, phones = await self.gateway.batch_get(self.worksheet, ['A2:A', 'C2:C'])
+        logger.info(f"Получено {len(codes)} строк для поиска пользователя")
+        self._partner_index = self._build_partner_index(codes, phones)
+        self._partner_index_revision = revision
+        self._partner_index_ts = time.monotonic()
+
+    async def _adopt_own_revision(self) -> None:
+        """
+        Переносит индекс партнеров на ревизию таблицы после собственной записи.
+        
+        Бот пишет только D:F, а индекс зависит лишь от колонок A и C, поэтому
+        своя запись не должна перестраивать индекс при следующей авторизации.
+        Чужую правку, совпавшую с записью по времени, поймают промах и TTL.
+        """
+        known = self._partner_index_revision
+        if known is None:
+            return
+        try:
+            revision = await self.gateway.get_last_update_time(self.worksheet)
+        except Exception as e:
+            logger.debug(f"Не удалось получить ревизию таблицы авторизации после записи: {e}")
+            return
+        async with self._partner_index_lock:
+            if self._partner_index_revision == known:
+                self._partner_index_revision = revision
+
+    @staticmethod
+    def _build_partner_index(codes: List[List], phones: List[List]) -> Dict[Tuple[str, str], int]:
+        """Строит индекс (код, нормализованный телефон) -> номер строки."""
+        index: Dict[Tuple[str, str], int] = {}
+        for i, code_cells in enumerate(codes, start=2):  # start=2 потому что строка 1 - заголовки
+            # Строки без кода партнера не ищутся никогда — не тратим на них
+            # нормализацию телефона
+            if not code_cells:
+                continue
+            code_in_row = str(code_cells[0]).strip()
+            if not code_in_row:
+                continue
+            phone_cells = phones[i - 2] if i - 2 < len(phones) else []
+            phone_in_row = str(phone_cells[0] if phone_cells else '').strip()
+            # setdefault: при дублях побеждает первая строка, как при линейном поиске
+            index.setdefault((code_in_row, normalize_phone(phone_in_row)), i)
+        return index
+
+    async def _queue_auth_write(self, range_name: str, row_values: List) -> None:
+        """
+        Ставит запись строки в буфер и ждет, пока пачка будет записана.
+        
+        Одновременные авторизации сливаются в один batchUpdate; ошибка записи
+        пачки пробрасывается каждому ожидающему.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending_writes.append(({'range': range_name, 'values': [row_values]}, future))
+        
+        if len(self._pending_writes) >= _AUTH_WRITE_BATCH_SIZE:
+            await self.flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+        
+        await future
+
+    async def _delayed_flush(self) -> None:
+        """Сбрасывает буфер по таймеру."""
+        await asyncio.sleep(_AUTH_WRITE_BATCH_DELAY)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Записывает все накопленные обновления авторизации одним batchUpdate.
+        Вызывается при переполнении буфера, по таймеру и при остановке бота.
+        """
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        
+        batch, self._pending_writes = self._pending_writes, []
+        if not batch:
+            return
+        
+        try:
+            await self.gateway.batch_update(self.worksheet, [data for data, _ in batch])
+            logger.info(f"Записано {len(batch)} обновлений авторизации одним batchUpdate")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+        await self._adopt_own_revision()
+
     async def get_user_auth_status(self, telegram_id: int) -> bool:
         """
         Проверяет статус авторизации пользователя по Telegram ID.
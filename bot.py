@@ -32,7 +32,7 @@ logger = logging.getLogger(__name__)
 from auth_service import AuthService  # noqa: E402
 from utils import alert_admin  # noqa: E402
 from handlers import setup_handlers  # noqa: E402
-from ai_service import AIService  # noqa: E402
+from ai_service import AIService, get_ai_service  # noqa: E402
 from response_monitor import ResponseMonitor  # noqa: E402
 from promotions_notifier import PromotionsNotifier  # noqa: E402
 from appeals_service import AppealsService  # noqa: E402
@@ -168,7 +168,7 @@ def _run_bot_main():
     # Инициализация AI сервиса
     try:
         logger.info("Инициализация AIService...")
-        ai_service = AIService(promotions_gateway=promotions_gateway)
+        ai_service = get_ai_service(promotions_gateway=promotions_gateway)
         if not ai_service.is_enabled():
             logger.warning("AIService отключен: ни один провайдер не доступен")
         else:
@@ -357,6 +357,10 @@ def _run_bot_main():
             except Exception as e:
                 logger.error(f"Ошибка запуска мониторинга здоровья: {e}", exc_info=True)
         
+        # Прогрев сервиса обращений (индекс строк, форматирование статусов) в фоне
+        if appeals_service and appeals_service.is_available():
+            task_tracker.create_tracked_task(appeals_service.initialize(), "appeals_init")
+
         # Запуск мониторинга ответов специалистов
         if response_monitor and appeals_service and appeals_service.is_available():
             logger.info("Запуск мониторинга ответов специалистов...")
@@ -522,6 +526,20 @@ def _run_bot_main():
             except Exception as e:
                 logger.error(f"Ошибка остановки PollingWatchdog: {e}")
 
+        # Дописываем отложенные обновления авторизации
+        if auth_service:
+            try:
+                await auth_service.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи буфера авторизации: {e}")
+
+        # Дописываем отложенные правки обращений
+        if appeals_service:
+            try:
+                await appeals_service.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи очереди обращений: {e}")
+
         # Закрытие AI-клиента и других сетевых ресурсов
         if ai_service:
             try:
@@ -192,7 +192,7 @@ class BotHealthMonitor:
             from sheets_gateway import _get_client_and_sheet
 
             logger.info("Переподключение к Google Sheets...")
-            _, worksheet = _get_client_and_sheet()
+            _, worksheet = _get_client_and_sheet(force_refresh=True)
             
             if worksheet:
                 self.auth_service.worksheet = worksheet
@@ -4,105 +4,152 @@
 Читает заголовки и первые несколько строк всех листов.
 """
 
+import asyncio
+import re
+import sys
+
 from dotenv import load_dotenv
+from gspread.utils import fill_gaps, to_records
 from sheets import _get_client_and_sheet, SheetsNotConfiguredError
 
-def analyze_spreadsheet():
-    """Анализирует структуру таблицы и выводит информацию о листах."""
+# Признаки ключевых колонок (код, телефон, статус, telegram, дата)
+_KEY_RE = re.compile(r"код|code|телефон|phone|статус|status|telegram|дата|date", re.IGNORECASE)
+
+
+def _is_appeals_sheet(worksheet) -> bool:
+    title = worksheet.title.lower()
+    return 'обращения' in title or 'appeals' in title
+
+
+def _a1_sheet(title: str) -> str:
+    """Имя листа в A1-нотации (кавычки внутри имени удваиваются)."""
+    return "'" + title.replace("'", "''") + "'"
+
+async def analyze_spreadsheet():
+    """Анализирует структуру таблицы и выводит информацию о листах.
+
+    Блокирующие вызовы gspread выполняются в потоках (asyncio.to_thread),
+    независимые запросы к API идут параллельно. Отчёт копится в буфере
+    и выводится одной записью в stdout.
+    """
+    out = []
+
+    def emit(text: str = "") -> None:
+        out.append(f"{text}\n")
+
     try:
         # Загружаем .env
         load_dotenv()
         
         # Получаем клиент и основную таблицу
-        client, main_worksheet = _get_client_and_sheet()
+        client, main_worksheet = await asyncio.to_thread(_get_client_and_sheet)
         spreadsheet = main_worksheet.spreadsheet
         
-        print(f"📊 Анализ таблицы: {spreadsheet.title}")
-        print(f"🔗 ID таблицы: {spreadsheet.id}")
-        print(f"📋 URL: https://docs.google.com/spreadsheets/d/{spreadsheet.id}")
-        print("=" * 80)
+        emit(f"📊 Анализ таблицы: {spreadsheet.title}")
+        emit(f"🔗 ID таблицы: {spreadsheet.id}")
+        emit(f"📋 URL: https://docs.google.com/spreadsheets/d/{spreadsheet.id}")
+        emit("=" * 80)
         
         # Получаем все листы
-        worksheets = spreadsheet.worksheets()
-        print(f"📄 Найдено листов: {len(worksheets)}")
-        print()
+        worksheets = await asyncio.to_thread(spreadsheet.worksheets)
+        emit(f"📄 Найдено листов: {len(worksheets)}")
+        emit()
+        
+        # Один batchGet на всю таблицу (заголовок + 3 строки каждого листа)
+        # и параллельно — полное чтение листа "Обращения" для анализа ниже.
+        appeals_sheet = next((ws for ws in worksheets if _is_appeals_sheet(ws)), None)
+        ranges = [f"{_a1_sheet(ws.title)}!A1:Z5" for ws in worksheets]
+        preview_call = asyncio.to_thread(spreadsheet.values_batch_get, ranges)
+        if appeals_sheet:
+            batch, appeals_data = await asyncio.gather(
+                preview_call,
+                asyncio.to_thread(spreadsheet.values_get, _a1_sheet(appeals_sheet.title)),
+                return_exceptions=True,
+            )
+        else:
+            batch, appeals_data = await preview_call, None
+        if isinstance(batch, Exception):
+            raise batch
+        value_ranges = batch.get('valueRanges', [])
+        sheet_values = {
+            ws.id: (value_ranges[idx].get('values', []) if idx < len(value_ranges) else [])
+            for idx, ws in enumerate(worksheets)
+        }
         
         for i, worksheet in enumerate(worksheets, 1):
-            print(f"📝 Лист {i}: '{worksheet.title}'")
-            print(f"   Размер: {worksheet.row_count} строк × {worksheet.col_count} колонок")
+            emit(f"📝 Лист {i}: '{worksheet.title}'")
+            emit(f"   Размер: {worksheet.row_count} строк × {worksheet.col_count} колонок")
             
             try:
-                # Читаем заголовки (первая строка)
-                headers = worksheet.row_values(1)
-                print(f"   Заголовки ({len(headers)}): {headers}")
+                values = sheet_values[worksheet.id]
+                # Заголовки (первая строка)
+                headers = values[0] if values else []
+                emit(f"   Заголовки ({len(headers)}): {headers}")
                 
-                # Читаем первые 3 строки данных
+                # Первые 3 строки данных
                 if worksheet.row_count > 1:
-                    print("   Первые строки данных:")
+                    emit("   Первые строки данных:")
                     for row_num in range(2, min(5, worksheet.row_count + 1)):
-                        row_data = worksheet.row_values(row_num)
-                        print(f"     Строка {row_num}: {row_data}")
+                        row_data = values[row_num - 1] if row_num <= len(values) else []
+                        emit(f"     Строка {row_num}: {row_data}")
                 
                 # Проверяем наличие ключевых колонок
-                key_columns = []
-                for header in headers:
-                    header_lower = header.lower()
-                    if any(keyword in header_lower for keyword in ['код', 'code', 'телефон', 'phone', 'статус', 'status', 'telegram', 'дата', 'date']):
-                        key_columns.append(header)
+                key_columns = [header for header in headers if _KEY_RE.search(header)]
                 
                 if key_columns:
-                    print(f"   🔑 Ключевые колонки: {key_columns}")
+                    emit(f"   🔑 Ключевые колонки: {key_columns}")
                 
             except Exception as e:
-                print(f"   ❌ Ошибка чтения листа: {e}")
+                emit(f"   ❌ Ошибка чтения листа: {e}")
             
-            print("-" * 60)
+            emit("-" * 60)
         
         # Специальный анализ листа "Обращения"
-        print("\n🔍 Детальный анализ листа 'Обращения':")
+        emit("\n🔍 Детальный анализ листа 'Обращения':")
         try:
-            appeals_sheet = None
-            for worksheet in worksheets:
-                if 'обращения' in worksheet.title.lower() or 'appeals' in worksheet.title.lower():
-                    appeals_sheet = worksheet
-                    break
-            
             if appeals_sheet:
-                print(f"✅ Найден лист: '{appeals_sheet.title}'")
+                emit(f"✅ Найден лист: '{appeals_sheet.title}'")
                 
-                # Читаем все данные
-                all_data = appeals_sheet.get_all_records()
-                print(f"📊 Всего записей: {len(all_data)}")
+                # Данные уже получены параллельно с batchGet выше
+                if isinstance(appeals_data, Exception):
+                    raise appeals_data
+                values = appeals_data.get('values', [])
+                values = fill_gaps(values) if values else []
+                all_data = to_records(values[0], values[1:]) if values else []
+                emit(f"📊 Всего записей: {len(all_data)}")
                 
                 if all_data:
-                    print("\n📋 Структура данных:")
+                    emit("\n📋 Структура данных:")
                     for i, record in enumerate(all_data[:3], 1):  # Первые 3 записи
-                        print(f"   Запись {i}:")
+                        emit(f"   Запись {i}:")
                         for key, value in record.items():
-                            print(f"     {key}: {value}")
-                        print()
+                            emit(f"     {key}: {value}")
+                        emit()
                 
                 # Анализ колонок
                 if all_data:
                     headers = list(all_data[0].keys())
-                    print(f"📝 Все колонки ({len(headers)}):")
+                    emit(f"📝 Все колонки ({len(headers)}):")
                     for i, header in enumerate(headers, 1):
-                        print(f"   {i:2d}. {header}")
+                        emit(f"   {i:2d}. {header}")
                 
             else:
-                print("❌ Лист 'Обращения' не найден")
-                print("Доступные листы:")
+                emit("❌ Лист 'Обращения' не найден")
+                emit("Доступные листы:")
                 for worksheet in worksheets:
-                    print(f"   - {worksheet.title}")
+                    emit(f"   - {worksheet.title}")
                     
         except Exception as e:
-            print(f"❌ Ошибка анализа листа 'Обращения': {e}")
+            emit(f"❌ Ошибка анализа листа 'Обращения': {e}")
             
     except SheetsNotConfiguredError as e:
-        print(f"❌ Ошибка конфигурации Google Sheets: {e}")
-        print("Убедитесь, что в .env заданы SHEET_ID, GCP_SA_JSON или GCP_SA_FILE")
+        emit(f"❌ Ошибка конфигурации Google Sheets: {e}")
+        emit("Убедитесь, что в .env заданы SHEET_ID, GCP_SA_JSON или GCP_SA_FILE")
     except Exception as e:
-        print(f"❌ Общая ошибка: {e}")
+        emit(f"❌ Общая ошибка: {e}")
+    finally:
+        sys.stdout.write("".join(out))
+        sys.stdout.flush()
 
 if __name__ == "__main__":
-    analyze_spreadsheet()
+    asyncio.run(analyze_spreadsheet())
@@ -95,6 +95,19 @@ class GeminiService:
         """Initializes the service and downloads the dynamic system prompt."""
         await self.refresh_system_prompt(force=False)
         
+    async def warmup(self) -> bool:
+        """Лёгкий запрос метаданных модели: заранее поднимает TLS-соединение,
+        чтобы первый пользовательский запрос не платил за handshake."""
+        if not self.client:
+            return False
+        try:
+            await asyncio.wait_for(self.client.aio.models.get(model=self.model_name), timeout=15)
+            logger.info("Gemini warmup OK: model=%s", self.model_name)
+            return True
+        except Exception as e:
+            logger.warning(f"Gemini warmup не удался (не критично): {e}")
+            return False
+        
     async def wait_for_ready(self):
         """Проверяет доступность клиента."""
         return self.client is not None
@@ -278,8 +291,12 @@ class GeminiService:
                 )
                 raise
 
-    async def ask(self, user_id: int, content: str, external_history: Optional[str] = None, system_context: Optional[str] = None) -> Optional[str]:
-        """Отправляет запрос (не-streaming) с retry для WARP."""
+    async def ask(self, user_id: int, content: str, external_history: Optional[str] = None, system_context: Optional[str] = None, record_history: bool = True) -> Optional[str]:
+        """Отправляет запрос (не-streaming) с retry для WARP.
+
+        record_history=False — ответ не пишется в историю: её пишет вызывающий
+        через record_exchange (например, только для выигравшего hedged-вызова).
+        """
         if not self.client:
             logger.error("Gemini клиент не инициализирован")
             return None
@@ -309,9 +326,8 @@ class GeminiService:
 
                 full_reply = response.text if response.text else ""
 
-                if full_reply:
-                    self._add_to_history(user_id, "user", content)
-                    self._add_to_history(user_id, "assistant", full_reply)
+                if full_reply and record_history:
+                    self.record_exchange(user_id, content, full_reply)
 
                 return full_reply if full_reply else None
 
@@ -339,6 +355,11 @@ class GeminiService:
             self.user_histories[user_id] = []
         return self.user_histories[user_id]
 
+    def record_exchange(self, user_id: int, content: str, reply: str) -> None:
+        """Записывает в историю пару вопрос/ответ."""
+        self._add_to_history(user_id, "user", content)
+        self._add_to_history(user_id, "assistant", reply)
+
     def _add_to_history(self, user_id: int, role: str, content: str) -> None:
         history = self._get_or_create_history(user_id)
         history.append({"role": role, "content": content})
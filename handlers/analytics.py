@@ -326,12 +326,16 @@ async def _get_queue_worksheet(gateway):
             "https://www.googleapis.com/auth/spreadsheets",
             "https://www.googleapis.com/auth/drive",
         ]
-        creds = Credentials.from_service_account_file(sa_file, scopes=scopes)
-        client = gspread.authorize(creds)
 
-        spreadsheet = client.open_by_key(analytics_sheet_id)
-        worksheet = spreadsheet.worksheet(QUEUE_SHEET_NAME)
-        return worksheet
+        def _open_queue_worksheet():
+            creds = Credentials.from_service_account_file(sa_file, scopes=scopes)
+            client = gspread.authorize(creds)
+            spreadsheet = client.open_by_key(analytics_sheet_id)
+            return spreadsheet.worksheet(QUEUE_SHEET_NAME)
+
+        # Авторизация и открытие таблицы — блокирующие HTTP-запросы,
+        # выполняем их вне event loop бота
+        return await asyncio.to_thread(_open_queue_worksheet)
 
     except Exception as e:
         logger.error(f"Ошибка подключения к листу 'Очередь': {e}", exc_info=True)
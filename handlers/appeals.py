@@ -8,6 +8,8 @@ from error_handler import safe_handler
 
 logger = logging.getLogger(__name__)
 
+_STATUS_EMOJI = {'новое': '🆕', 'в обработке': '⏳', 'решено': '✅'}
+
 def register_appeals_handlers(application, auth_service: AuthService, appeals_service: AppealsService):
     """Регистрация обработчиков обращений."""
     application.add_handler(CommandHandler("appeals", appeals_command_handler(auth_service, appeals_service)))
@@ -32,19 +34,19 @@ def appeals_command_handler(auth_service: AuthService, appeals_service: AppealsS
                 await update.message.reply_text("У вас пока нет обращений.")
                 return
 
-            message = "📋 Ваши обращения:\n\n"
+            parts = ["📋 Ваши обращения:\n\n"]
             for i, a in enumerate(appeals, 1):
                 status = a.get('статус', 'неизвестно').lower()
-                emoji = {'новое': '🆕', 'в обработке': '⏳', 'решено': '✅'}.get(status, '❓')
+                emoji = _STATUS_EMOJI.get(status, '❓')
                 
-                message += f"{i}. {emoji} {status.upper()}\n"
+                parts.append(f"{i}. {emoji} {status.upper()}\n")
                 text = a.get('текст_обращений', '').split('\n')[:2]
                 for line in text:
                     if line.strip():
-                        message += f"   📝 {line[:70]}...\n"
-                message += f"   🕒 {a.get('время_обновления', '')}\n\n"
+                        parts.append(f"   📝 {line[:70]}...\n")
+                parts.append(f"   🕒 {a.get('время_обновления', '')}\n\n")
 
-            await update.message.reply_text(message)
+            await update.message.reply_text(''.join(parts))
         except Exception as e:
             logger.error(f"Ошибка /appeals: {e}")
             await update.message.reply_text("Ошибка при получении списка обращений.")
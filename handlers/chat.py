@@ -19,6 +19,9 @@ from escalation_manager import is_escalation_request, get_escalation_message
 
 logger = logging.getLogger(__name__)
 
+# Читается один раз при импорте, а не на каждое сообщение
+_RAG_DISABLED = os.getenv("RAG_DISABLED", "false").lower() in ("1", "true", "yes", "y")
+
 def register_chat_handlers(application, auth_service, ai_service, appeals_service, profile_manager=None):
     """Регистрация обработчиков чата."""
     application.add_handler(MessageHandler(
@@ -114,7 +117,7 @@ def chat_handler(auth_service: AuthService, ai_service: AIService, appeals_servi
 
         # 7. Адаптация контекста в зависимости от уровня
         use_rag = cascade_level >= 3 and should_use_rag(complexity)
-        if os.getenv("RAG_DISABLED", "false").lower() in ("1", "true", "yes", "y"):
+        if _RAG_DISABLED:
             use_rag = False
         use_memory = cascade_level >= 4 and should_use_memory(complexity)
 
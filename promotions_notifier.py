@@ -6,6 +6,8 @@ import aiohttp
 from typing import List, Dict, Optional
 from urllib.parse import urlparse, parse_qs
 
+from gspread.utils import rowcol_to_a1
+
 from promotions_api import check_new_promotions, is_promotions_available
 from auth_service import AuthService
 from sheets_gateway import AsyncGoogleSheetsGateway
@@ -66,7 +68,9 @@ class PromotionsNotifier:
                     download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
                     logger.info(f"Downloading from Google Drive: {download_url}")
                     async with session.get(download_url, timeout=aiohttp.ClientTimeout(total=15)) as response:
-                        response.raise_for_status()
+                        if response.status >= 400:
+                            logger.warning(f"Google Drive download failed: HTTP {response.status}")
+                            return None
                         content = await response.read()
                     if len(content) > 20 * 1024 * 1024:
                         logger.warning(f"File from Drive is too large: {len(content)} bytes")
@@ -77,7 +81,9 @@ class PromotionsNotifier:
             if content_url.startswith('http'):
                 logger.debug(f"Detected direct URL: {content_url}")
                 async with session.get(content_url, timeout=aiohttp.ClientTimeout(total=15)) as response:
-                    response.raise_for_status()
+                    if response.status >= 400:
+                        logger.warning(f"Media download failed: HTTP {response.status} for {content_url[:50]}...")
+                        return None
                     content = await response.read()
                 if len(content) > 20 * 1024 * 1024:
                     logger.warning(f"File from URL is too large: {len(content)} bytes")
@@ -167,36 +173,54 @@ class PromotionsNotifier:
             if not authorized_users:
                 return
                 
-            for promotion in new_promotions:
-                # 1. Отправляем уведомления
-                await self._send_promotion_notification(promotion, authorized_users)
-                
-                # 2. Маркируем как SENT в таблице (Дедупликация)
-                row_index = promotion.get('row_index')
-                col_index = promotion.get('status_col_index')
-                
-                if row_index and col_index:
-                    try:
-                        # Получаем worksheet (для этого нам нужен spreadsheet_id и название из окружения)
-                        import os
-                        sheet_id = os.environ.get('PROMOTIONS_SHEET_ID')
-                        sheet_name = os.environ.get('PROMOTIONS_SHEET_NAME', 'Sheet1')
-                        
-                        client = await self.gateway.authorize_client()
-                        spreadsheet = await self.gateway.open_spreadsheet(client, sheet_id)
-                        worksheet = await self.gateway.get_worksheet_async(spreadsheet, sheet_name)
-                        
-                        await self.gateway.update_cell(worksheet, row_index, col_index, 'SENT')
-                        logger.info(f"Акция в строке {row_index} помечена как SENT")
-                    except Exception as e:
-                        logger.error(f"Не удалось обновить статус SENT в строке {row_index}: {e}")
-                
-                # 3. Добавляем в локальный кэш (на всякий случай)
-                self.sent_promotions.add(promotion['id'])
+            sent_marks = []
+            try:
+                for promotion in new_promotions:
+                    # 1. Отправляем уведомления (если отметка SENT не записалась
+                    # в прошлый раз, повторно не рассылаем, только пишем отметку)
+                    if promotion['id'] not in self.sent_promotions:
+                        await self._send_promotion_notification(promotion, authorized_users)
+                    
+                    # 2. Запоминаем отметку SENT (пишем в таблицу одним запросом ниже)
+                    row_index = promotion.get('row_index')
+                    col_index = promotion.get('status_col_index')
+                    if row_index and col_index:
+                        sent_marks.append({
+                            'range': rowcol_to_a1(row_index, col_index),
+                            'values': [['SENT']],
+                        })
+                    
+                    # 3. Добавляем в локальный кэш (на всякий случай)
+                    self.sent_promotions.add(promotion['id'])
+            finally:
+                # Отметки уже разосланных акций пишем даже при ошибке или отмене
+                # на следующей акции, иначе после рестарта они уйдут повторно
+                await self._mark_sent(sent_marks)
                     
         except Exception as e:
             logger.error(f"Ошибка при проверке уведомлений: {e}")
     
+    async def _mark_sent(self, sent_marks: List[Dict]):
+        """Маркирует акции как SENT в таблице (дедупликация) одним batch_update"""
+        if not sent_marks:
+            return
+        try:
+            # Получаем worksheet (для этого нам нужен spreadsheet_id и название из окружения)
+            import os
+            sheet_id = os.environ.get('PROMOTIONS_SHEET_ID')
+            sheet_name = os.environ.get('PROMOTIONS_SHEET_NAME', 'Sheet1')
+            
+            client = await self.gateway.authorize_client()
+            spreadsheet = await self.gateway.open_spreadsheet(client, sheet_id)
+            worksheet = await self.gateway.get_worksheet_async(spreadsheet, sheet_name)
+            
+            await self.gateway.batch_update(worksheet, sent_marks)
+            logger.info(
+                f"Акции помечены как SENT: {', '.join(m['range'] for m in sent_marks)}"
+            )
+        except Exception as e:
+            logger.error(f"Не удалось обновить статус SENT ({len(sent_marks)} акций): {e}")
+    
     async def _get_authorized_users(self) -> List[int]:
         """Получает список ID авторизованных пользователей"""
         try:
@@ -6,10 +6,13 @@ import logging
 import asyncio
 import json
 import os
+import threading
+import time
 from pathlib import Path
 from typing import List, Dict, Optional, Any, Callable
 import gspread
 from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
 from tenacity import (
     retry,
     stop_after_attempt,
@@ -27,20 +30,54 @@ from sheets_utils import (
     CircuitBreakerOpenError
 )
 
+try:
+    import orjson  # необязательная зависимость: быстрый разбор ответов Sheets API
+except ImportError:
+    orjson = None
+
 # Загружаем переменные окружения
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
 
+class _OrjsonHTTPClient(HTTPClient):
+    """HTTPClient gspread, разбирающий JSON-ответы через orjson вместо json."""
+
+    def request(self, *args, **kwargs):
+        response = super().request(*args, **kwargs)
+        content = response.content
+        response.json = lambda **_: orjson.loads(content)
+        return response
+
+
 class SheetsNotConfiguredError(Exception):
     """Ошибка конфигурации Google Sheets"""
     pass
 
 
+class _AsciiDigitsTable(dict):
+    """Таблица для str.translate: оставляет только ASCII-цифры 0-9.
+
+    Остальные символы удаляются; __missing__ запоминает их, так что
+    повторные символы разрешаются без вызова Python-кода.
+    """
+
+    def __missing__(self, key: int) -> None:
+        self[key] = None
+        return None
+
+
+_DIGITS_ONLY = _AsciiDigitsTable({code: code for code in range(ord('0'), ord('9') + 1)})
+
+
 def normalize_phone(phone: str) -> str:
-    """Нормализация номера телефона к формату 8XXXXXXXXXX"""
-    digits = ''.join(ch for ch in (phone or '') if ch.isdigit())
+    """Нормализация номера телефона к формату 8XXXXXXXXXX
+
+    Учитываются только ASCII-цифры (юникодные цифры вроде '٣' или '²',
+    которые пропускал str.isdigit, отбрасываются).
+    """
+    digits = str(phone or '').translate(_DIGITS_ONLY)
     if len(digits) == 10:
         return '8' + digits
     elif len(digits) == 11 and digits.startswith('7'):
@@ -71,33 +108,65 @@ def _load_service_account():
     )
 
 
-def _get_client_and_sheet():
+# Кэш авторизованного клиента и открытых листов: без него каждый вызов
+# заново подписывает JWT и делает open_by_key + worksheet (2-3 запроса).
+_HANDLE_CACHE_TTL = int(os.environ.get('SHEETS_HANDLE_CACHE_TTL', '600'))
+_handle_cache: Dict[Any, tuple] = {}
+_handle_cache_lock = threading.Lock()
+
+
+def _cached_handle(key: Any, factory: Callable[[], Any], force_refresh: bool = False) -> Any:
+    """Возвращает закэшированный объект gspread или создаёт его (double-checked lock)."""
+    entry = _handle_cache.get(key)
+    if not force_refresh and entry and time.monotonic() - entry[1] < _HANDLE_CACHE_TTL:
+        return entry[0]
+    with _handle_cache_lock:
+        entry = _handle_cache.get(key)
+        if not force_refresh and entry and time.monotonic() - entry[1] < _HANDLE_CACHE_TTL:
+            return entry[0]
+        value = factory()
+        _handle_cache[key] = (value, time.monotonic())
+        return value
+
+
+def _authorize() -> gspread.Client:
+    from google.oauth2.service_account import Credentials
+    
+    sa_info = _load_service_account()
+    scopes = [
+        'https://www.googleapis.com/auth/spreadsheets',
+        'https://www.googleapis.com/auth/drive'
+    ]
+    
+    creds = Credentials.from_service_account_info(sa_info, scopes=scopes)
+    return gspread.authorize(creds, http_client=_OrjsonHTTPClient if orjson else HTTPClient)
+
+
+def _get_authorized_client(force_refresh: bool = False) -> gspread.Client:
+    """Авторизованный gspread клиент (общий на процесс)."""
+    return _cached_handle('client', _authorize, force_refresh)
+
+
+def _get_client_and_sheet(force_refresh: bool = False):
     """Получение клиента и листа Google Sheets (для инициализации)"""
     try:
-        import gspread
-        from google.oauth2.service_account import Credentials
-        
-        sa_info = _load_service_account()
-        scopes = [
-            'https://www.googleapis.com/auth/spreadsheets',
-            'https://www.googleapis.com/auth/drive'
-        ]
-        
-        creds = Credentials.from_service_account_info(sa_info, scopes=scopes)
-        client = gspread.authorize(creds)
+        client = _get_authorized_client(force_refresh)
         
         sheet_id = os.environ.get('SHEET_ID')
         if not sheet_id:
             raise SheetsNotConfiguredError('SHEET_ID not provided')
         
-        spreadsheet = client.open_by_key(sheet_id)
         sheet_name = os.environ.get('SHEET_NAME', 'Sheet1')
-        try:
-            worksheet = spreadsheet.worksheet(sheet_name)
-        except Exception as e:
-            logger.warning(f"Worksheet '{sheet_name}' not found ({e}). Falling back to first sheet.")
-            worksheet = spreadsheet.sheet1
 
+        def _open():
+            spreadsheet = client.open_by_key(sheet_id)
+            try:
+                return spreadsheet.worksheet(sheet_name)
+            except Exception as e:
+                logger.warning(f"Worksheet '{sheet_name}' not found ({e}). Falling back to first sheet.")
+                return spreadsheet.sheet1
+
+        worksheet = _cached_handle(('worksheet', sheet_id, sheet_name), _open, force_refresh)
         return client, worksheet
     
     except ImportError as e:
@@ -107,33 +176,26 @@ def _get_client_and_sheet():
         raise SheetsNotConfiguredError(f'Google Sheets connection failed: {e}')
 
 
-def _get_appeals_client_and_sheet():
+def _get_appeals_client_and_sheet(force_refresh: bool = False):
     """Получение клиента и листа для таблицы обращений (для инициализации)"""
     try:
-        import gspread
-        from google.oauth2.service_account import Credentials
-        
-        sa_info = _load_service_account()
-        scopes = [
-            'https://www.googleapis.com/auth/spreadsheets',
-            'https://www.googleapis.com/auth/drive'
-        ]
-        
-        creds = Credentials.from_service_account_info(sa_info, scopes=scopes)
-        client = gspread.authorize(creds)
+        client = _get_authorized_client(force_refresh)
         
         sheet_id = os.environ.get('APPEALS_SHEET_ID')
         if not sheet_id:
             raise SheetsNotConfiguredError('APPEALS_SHEET_ID not provided')
         
-        spreadsheet = client.open_by_key(sheet_id)
         sheet_name = os.environ.get('APPEALS_SHEET_NAME', 'обращения')
-        try:
-            worksheet = spreadsheet.worksheet(sheet_name)
-        except Exception as e:
-            logger.warning(f"Appeals worksheet '{sheet_name}' not found ({e}). Falling back to first sheet.")
-            worksheet = spreadsheet.sheet1
 
+        def _open():
+            spreadsheet = client.open_by_key(sheet_id)
+            try:
+                return spreadsheet.worksheet(sheet_name)
+            except Exception as e:
+                logger.warning(f"Appeals worksheet '{sheet_name}' not found ({e}). Falling back to first sheet.")
+                return spreadsheet.sheet1
+
+        worksheet = _cached_handle(('worksheet', sheet_id, sheet_name), _open, force_refresh)
         return client, worksheet
     
     except ImportError as e:
@@ -226,6 +288,8 @@ class AsyncGoogleSheetsGateway:
         # TTL Cache для записей
         self._records_cache: Dict[str, Dict[str, Any]] = {}
         self.cache_ttl = int(os.environ.get('SHEETS_CACHE_TTL', '60'))  # По умолчанию 1 минута
+        # Идущие чтения листов: одновременные промахи кэша ждут одно чтение
+        self._records_inflight: Dict[str, asyncio.Task] = {}
     
     def _get_circuit_breaker(self):
         """Получает соответствующий Circuit Breaker."""
@@ -323,7 +387,7 @@ class AsyncGoogleSheetsGateway:
             Список словарей с данными записей
         """
         import time
-        cache_key = f"{worksheet.spreadsheet.id}_{worksheet.id}"
+        cache_key = self._records_cache_key(worksheet)
         
         if use_cache and cache_key in self._records_cache:
             cache_entry = self._records_cache[cache_key]
@@ -331,37 +395,71 @@ class AsyncGoogleSheetsGateway:
                 logger.debug(f"Returning cached records for {worksheet.title} (age: {int(time.time() - cache_entry['timestamp'])}s)")
                 return cache_entry['data']
 
-        records = await self._run_in_executor(worksheet.get_all_records)
+        if not use_cache:
+            return await self._run_in_executor(worksheet.get_all_records)
+        
+        task = self._records_inflight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(self._run_in_executor(worksheet.get_all_records))
+            self._records_inflight[cache_key] = task
+            task.add_done_callback(lambda t: self._finish_records_read(cache_key, t))
         
-        # Обновляем кэш
-        if use_cache:
+        # shield: отмена одного из ожидающих не прерывает общее чтение
+        return await asyncio.shield(task)
+
+    def _finish_records_read(self, cache_key: str, task: asyncio.Task) -> None:
+        """Кладет результат общего чтения в кэш, если за время чтения в лист не писали."""
+        if self._records_inflight.get(cache_key) is not task:
+            return
+        del self._records_inflight[cache_key]
+        if not task.cancelled() and task.exception() is None:
             self._records_cache[cache_key] = {
-                'data': records,
+                'data': task.result(),
                 'timestamp': time.time()
             }
-        
-        return records
+
+    @staticmethod
+    def _records_cache_key(worksheet: gspread.Worksheet) -> str:
+        """Ключ кэша записей: таблица + лист."""
+        return f"{worksheet.spreadsheet.id}_{worksheet.id}"
+
+    def _invalidate_records(self, worksheet: gspread.Worksheet) -> None:
+        """Сбрасывает кэш записей листа после записи в него."""
+        cache_key = self._records_cache_key(worksheet)
+        self._records_cache.pop(cache_key, None)
+        # Чтение, начатое до записи, не должно попасть в кэш и новым вызовам
+        self._records_inflight.pop(cache_key, None)
     
-    async def append_row(self, worksheet: gspread.Worksheet, values: List[Any]) -> None:
+    async def append_row(self, worksheet: gspread.Worksheet, values: List[Any]) -> Dict:
         """
         Добавляет строку в worksheet.
+        Возвращает ответ values.append (updates.updatedRange - записанный диапазон).
         """
         async with self._write_lock:
-            await self._run_in_executor(worksheet.append_row, values)
+            try:
+                return await self._run_in_executor(worksheet.append_row, values)
+            finally:
+                self._invalidate_records(worksheet)
 
     async def update(self, worksheet: gspread.Worksheet, range_name: str, values: List[List[Any]]) -> None:
         """
         Обновляет диапазон ячеек в worksheet.
         """
         async with self._write_lock:
-            await self._run_in_executor(worksheet.update, range_name, values)
+            try:
+                await self._run_in_executor(worksheet.update, range_name, values)
+            finally:
+                self._invalidate_records(worksheet)
 
     async def update_cell(self, worksheet: gspread.Worksheet, row: int, col: int, value: Any) -> None:
         """
         Обновляет одну ячейку в worksheet.
         """
         async with self._write_lock:
-            await self._run_in_executor(worksheet.update_cell, row, col, value)
+            try:
+                await self._run_in_executor(worksheet.update_cell, row, col, value)
+            finally:
+                self._invalidate_records(worksheet)
     
     async def find(self, worksheet: gspread.Worksheet, query: str, in_row: Optional[int] = None, in_column: Optional[int] = None) -> Optional[gspread.Cell]:
         """
@@ -430,12 +528,43 @@ class AsyncGoogleSheetsGateway:
         """
         return await self._run_in_executor(spreadsheet.worksheet, sheet_name)
     
+    async def batch_get(self, worksheet: gspread.Worksheet, ranges: List[str], major_dimension: Optional[str] = None) -> List[List[List[Any]]]:
+        """
+        Получает несколько диапазонов одним запросом (values.batchGet).
+        
+        Args:
+            worksheet: Worksheet объект из gspread
+            ranges: Список диапазонов в A1-нотации (например ['A2:A', 'C2:C'])
+            major_dimension: 'ROWS' (по умолчанию) или 'COLUMNS'
+            
+        Returns:
+            Список матриц значений в порядке ranges
+        """
+        if major_dimension:
+            return await self._run_in_executor(worksheet.batch_get, ranges, major_dimension=major_dimension)
+        return await self._run_in_executor(worksheet.batch_get, ranges)
+    
+    async def get_last_update_time(self, worksheet: gspread.Worksheet) -> str:
+        """
+        Возвращает modifiedTime таблицы из Drive API (дешёвый маркер ревизии).
+        
+        Args:
+            worksheet: Worksheet объект из gspread
+            
+        Returns:
+            Время последнего изменения таблицы (RFC 3339)
+        """
+        return await self._run_in_executor(worksheet.spreadsheet.get_lastUpdateTime)
+    
     async def batch_update(self, worksheet: gspread.Worksheet, data: List[Dict]) -> None:
         """
         Пакетное обновление ячеек.
         """
         async with self._write_lock:
-            await self._run_in_executor(worksheet.batch_update, data)
+            try:
+                await self._run_in_executor(worksheet.batch_update, data)
+            finally:
+                self._invalidate_records(worksheet)
 
     async def format(self, worksheet: gspread.Worksheet, range_name: str, format_dict: Dict) -> None:
         """
@@ -444,6 +573,20 @@ class AsyncGoogleSheetsGateway:
         async with self._write_lock:
             await self._run_in_executor(worksheet.format, range_name, format_dict)
 
+    async def fetch_sheet_metadata(self, worksheet: gspread.Worksheet, params: Optional[Dict] = None) -> Dict:
+        """
+        Получает метаданные таблицы (spreadsheets.get), например правила
+        условного форматирования листов.
+        """
+        return await self._run_in_executor(worksheet.spreadsheet.fetch_sheet_metadata, params)
+
+    async def spreadsheet_batch_update(self, worksheet: gspread.Worksheet, requests: List[Dict]) -> None:
+        """
+        Выполняет spreadsheets.batchUpdate (правила форматирования и т.п.).
+        """
+        async with self._write_lock:
+            await self._run_in_executor(worksheet.spreadsheet.batch_update, {'requests': requests})
+
     async def cell(self, worksheet: gspread.Worksheet, row: int, col: int) -> gspread.Cell:
         """
         Получает значение ячейки.
@@ -459,18 +602,8 @@ class AsyncGoogleSheetsGateway:
         return await self._run_in_executor(worksheet.cell, row, col)
 
     async def authorize_client(self) -> gspread.Client:
-        """Асинхронная авторизация клиента."""
-        def _auth():
-            from google.oauth2.service_account import Credentials
-            sa_info = _load_service_account()
-            scopes = [
-                'https://www.googleapis.com/auth/spreadsheets',
-                'https://www.googleapis.com/auth/drive'
-            ]
-            creds = Credentials.from_service_account_info(sa_info, scopes=scopes)
-            return gspread.authorize(creds)
-        
-        return await self._run_in_executor(_auth)
+        """Асинхронная авторизация клиента (переиспользует закэшированный клиент)."""
+        return await self._run_in_executor(_get_authorized_client)
 
     async def open_spreadsheet(self, client: gspread.Client, sheet_id: str) -> gspread.Spreadsheet:
         """Асинхронное открытие таблицы."""
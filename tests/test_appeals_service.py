@@ -0,0 +1,399 @@
+"""
+Тесты очереди правок, поиска строки и очистки истории в AppealsService.
+
+Google Sheets подменяется FakeGateway: лист хранится в памяти списком строк,
+первая строка - заголовки.
+"""
+
+import asyncio
+import datetime
+import re
+
+import pytest
+from gspread.exceptions import APIError
+
+import appeals_service
+from appeals_service import AppealsService
+
+HEADERS = ['код', 'телефон', 'фио', 'telegram_id', 'текст_обращений',
+           'статус', 'специалист_ответ', 'время_обновления']
+
+_CELL = re.compile(r'^([A-Z]+)(\d+)$')
+_RANGE = re.compile(r'^([A-Z]+)(\d+):([A-Z]+)(\d*)$')
+
+
+def _col(letters):
+    return ord(letters) - ord('A')
+
+
+class FakeResponse:
+    """Ответ Sheets API с ошибкой для APIError."""
+
+    def __init__(self, code, message):
+        self.code = code
+        self.text = message
+
+    def json(self):
+        return {'error': {'code': self.code, 'message': self.text, 'status': 'INVALID_ARGUMENT'}}
+
+
+class FakeWorksheet:
+    id = 0
+    title = 'обращения'
+
+
+class FakeGateway:
+    """Лист в памяти с методами gateway, которые использует AppealsService."""
+
+    def __init__(self, rows):
+        self.rows = [list(HEADERS)] + [list(r) for r in rows]
+        self.updates = []
+        self.conditional_formats = []
+        self.fail_metadata = 0
+        self.fail_updates = 0
+        self.reject_rows = set()
+        self.on_update = None
+
+    def _get(self, row, col):
+        cells = self.rows[row - 1] if row <= len(self.rows) else []
+        return cells[col] if col < len(cells) else ''
+
+    async def batch_update(self, worksheet, data):
+        if self.on_update:
+            self.on_update()
+        if self.fail_updates:
+            self.fail_updates -= 1
+            raise RuntimeError('quota exceeded')
+        rejected = {int(_CELL.match(d['range']).group(2)) for d in data} & self.reject_rows
+        if rejected:
+            raise APIError(FakeResponse(400, f'Range exceeds grid limits: row {min(rejected)}'))
+        self.updates.append(data)
+        for item in data:
+            col, row = _CELL.match(item['range']).groups()
+            cells = self.rows[int(row) - 1]
+            cells.extend([''] * (_col(col) + 1 - len(cells)))
+            cells[_col(col)] = item['values'][0][0]
+
+    async def batch_get(self, worksheet, ranges, major_dimension=None):
+        result = []
+        for a1 in ranges:
+            c1, r1, c2, r2 = _RANGE.match(a1).groups()
+            last = int(r2) if r2 else len(self.rows)
+            rows = [[self._get(r, c) for c in range(_col(c1), _col(c2) + 1)]
+                    for r in range(int(r1), last + 1)]
+            result.append([list(col) for col in zip(*rows)] if major_dimension == 'COLUMNS' else rows)
+        return result
+
+    async def append_row(self, worksheet, values):
+        self.rows.append(list(values))
+        return {'updates': {'updatedRange': f"'обращения'!A{len(self.rows)}:H{len(self.rows)}"}}
+
+    async def fetch_sheet_metadata(self, worksheet, params=None):
+        if self.fail_metadata:
+            self.fail_metadata -= 1
+            raise RuntimeError('service unavailable')
+        # Как и API, нулевые sheetId/startColumnIndex не возвращаем
+        return {'sheets': [{'properties': {}, 'conditionalFormats': list(self.conditional_formats)}]}
+
+    async def spreadsheet_batch_update(self, worksheet, requests):
+        self.conditional_formats.extend(r['addConditionalFormatRule']['rule'] for r in requests)
+
+
+@pytest.fixture
+def make_service(monkeypatch):
+    monkeypatch.setattr(appeals_service, '_get_appeals_client_and_sheet', lambda: (None, FakeWorksheet()))
+
+    def make(rows=()):
+        gateway = FakeGateway(rows)
+        return AppealsService(gateway=gateway), gateway
+    return make
+
+
+def _stamp(days_ago):
+    return (datetime.datetime.now() - datetime.timedelta(days=days_ago)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+# --- _stage / flush ---
+
+def test_stage_coalesces_edits_into_one_batch_update(make_service):
+    service, gateway = make_service([['c', 'p', 'f', '111', 'hist', 'Новое', '', '']])
+
+    async def scenario():
+        service._stage(2, {'F': 'В работе'})
+        service._stage(2, {'G': 'ответ'})
+        service._stage(2, {'F': 'Решено'})
+        await service.flush()
+
+    asyncio.run(scenario())
+    assert len(gateway.updates) == 1
+    assert sorted((d['range'], d['values']) for d in gateway.updates[0]) == [
+        ('F2', [['Решено']]), ('G2', [['ответ']]),
+    ]
+    assert service._pending == {}
+    assert service._flush_task is None
+    assert gateway.rows[1][5:7] == ['Решено', 'ответ']
+
+
+def test_flush_failure_requeues_without_overwriting_newer_edits(make_service):
+    service, gateway = make_service([['c', 'p', 'f', '111', 'hist', 'Новое', '', '']])
+    gateway.fail_updates = 1
+
+    def stage_during_write():
+        # Пока пачка пишется, ее правки видны читающим
+        assert service._edits_since(service._write_seq)[2]['F'] == 'В работе'
+        gateway.on_update = None
+        service._stage(2, {'F': 'Решено'})
+
+    async def scenario():
+        first = service._stage(2, {'F': 'В работе', 'G': 'ответ'})
+        gateway.on_update = stage_during_write
+        await service.flush()
+        assert service._pending == {2: {'F': 'Решено', 'G': 'ответ'}}
+        assert service._inflight == {}
+        assert service._flush_task is not None
+        # Вызывающий ждет повтора, а не получает ошибку первой попытки
+        assert not first.done()
+        await service.flush()
+        await first
+
+    asyncio.run(scenario())
+    assert len(gateway.updates) == 1
+    assert gateway.rows[1][5:7] == ['Решено', 'ответ']
+    assert service._pending == {}
+    assert service._flush_task is None
+
+
+# --- _row_history ---
+
+def test_row_history_reads_row_and_prefers_staged_text(make_service):
+    service, gateway = make_service([
+        ['c', 'p', 'f', '111', 'hist1', 'Новое', '', ''],
+        ['c', 'p', 'f', '222', 'hist2', 'Новое', '', ''],
+    ])
+
+    async def scenario():
+        first = await service._row_history(222)
+        service._stage(3, {'E': 'staged'})
+        second = await service._row_history(222)
+        missing = await service._row_history(333)
+        await service.flush()
+        return first, second, missing
+
+    first, second, missing = asyncio.run(scenario())
+    assert first == (3, 'hist2')
+    assert second == (3, 'staged')
+    assert missing == (None, '')
+
+
+def test_row_history_rebuilds_stale_index(make_service):
+    service, gateway = make_service([
+        ['c', 'p', 'f', '111', 'hist1', 'Новое', '', ''],
+        ['c', 'p', 'f', '222', 'hist2', 'Новое', '', ''],
+    ])
+
+    async def scenario():
+        await service._row_index()
+        # Оператор отсортировал лист: строки поменялись местами
+        gateway.rows[1], gateway.rows[2] = gateway.rows[2], gateway.rows[1]
+        return await service._row_history(111)
+
+    assert asyncio.run(scenario()) == (3, 'hist1')
+    assert service._row_idx == {'222': 2, '111': 3}
+
+
+# --- _append_to_snapshot ---
+
+def _snapshot_of(rows):
+    return [dict(zip(HEADERS, r)) for r in rows]
+
+
+def test_append_to_snapshot_extends_records_and_indexes(make_service):
+    service, _ = make_service()
+    service._records = _snapshot_of([['c', 'p', 'f', '111', 'hist1', 'Новое', '', '']])
+    service._index = {'111': 2}
+    service._row_idx = {'111': 2}
+
+    service._append_to_snapshot(['c2', 'p2', 'f2', 222, 'hist2', 'Новое', '', 'ts'], 3)
+
+    assert service._records[1]['telegram_id'] == 222
+    assert service._records[1]['время_обновления'] == 'ts'
+    assert service._index == {'111': 2, '222': 3}
+    assert service._row_idx == {'111': 2, '222': 3}
+
+
+def test_append_to_snapshot_drops_snapshot_on_gap(make_service):
+    service, _ = make_service()
+    service._records = _snapshot_of([['c', 'p', 'f', '111', 'hist1', 'Новое', '', '']])
+    service._row_idx = {'111': 2}
+
+    # Кто-то добавил строку в обход бота: новая строка 4, а не 3
+    service._append_to_snapshot(['c2', 'p2', 'f2', 222, 'hist2', 'Новое', '', 'ts'], 4)
+
+    assert service._records is None
+    assert service._row_idx == {'111': 2, '222': 4}
+
+
+def test_append_to_snapshot_without_row_invalidates(make_service):
+    service, _ = make_service()
+    service._records = _snapshot_of([['c', 'p', 'f', '111', 'hist1', 'Новое', '', '']])
+    service._row_idx = {'111': 2}
+
+    service._append_to_snapshot(['c2', 'p2', 'f2', 222, 'hist2', 'Новое', '', 'ts'], None)
+
+    assert service._records is None
+    assert service._row_idx is None
+
+
+def test_create_appeal_appends_new_row_and_prepends_history(make_service):
+    service, gateway = make_service([['c', 'p', 'f', '111', 'hist1', 'Новое', '', '']])
+
+    async def scenario():
+        assert await service.create_appeal('c2', 'p2', 'f2', 222, 'первое')
+        assert service._row_idx['222'] == 3
+        assert await service.create_appeal('c2', 'p2', 'f2', 222, 'второе')
+        await service.flush()
+
+    asyncio.run(scenario())
+    history = gateway.rows[2][4].split('\n')
+    assert [line.split(': ', 1)[1] for line in history] == ['второе', 'первое']
+
+
+# --- _cleanup_old_appeals ---
+
+def test_cleanup_drops_only_expired_entry_lines(make_service):
+    service, _ = make_service()
+    fresh, old = _stamp(1), _stamp(40)
+    text = (
+        f"{fresh}: новое\n"
+        "продолжение нового\n"
+        f"{old}: старое\n"
+        "ответ ИИ без даты\n"
+        "✅ Ваше обращение решено"
+    )
+
+    assert service._cleanup_old_appeals(text) == (
+        f"{fresh}: новое\n"
+        "продолжение нового\n"
+        "ответ ИИ без даты\n"
+        "✅ Ваше обращение решено"
+    )
+
+
+def test_cleanup_keeps_closed_marker_after_expired_last_entry(make_service):
+    service, _ = make_service()
+    old = _stamp(40)
+
+    assert service._cleanup_old_appeals(f"{old}: старое\n✅ Ваше обращение решено") == "✅ Ваше обращение решено"
+    assert service._cleanup_old_appeals(f"✅ Ваше обращение решено\n{old}: старое") == "✅ Ваше обращение решено"
+
+
+def test_cleanup_keeps_lines_that_only_look_dated(make_service):
+    service, _ = make_service()
+    old = _stamp(40)
+    text = (
+        f"{old} вставлено без двоеточия\n"
+        "  2020-01-01 00:00:00: с отступом\n"
+        "2020-13-45 00:00:00: некорректная дата"
+    )
+
+    assert service._cleanup_old_appeals(text) is text
+
+
+def test_cleanup_returns_text_unchanged_when_nothing_expired(make_service):
+    service, _ = make_service()
+    text = f"{_stamp(1)}: новое\n{_stamp(29)}: почти старое\n"
+
+    assert service._cleanup_old_appeals(text) is text
+    assert service._cleanup_old_appeals("   ") == "   "
+
+
+def test_permanent_failure_drops_only_the_bad_row(make_service):
+    service, gateway = make_service([
+        ['c', 'p', 'f', '111', 'hist1', 'Новое', '', ''],
+        ['c', 'p', 'f', '222', 'hist2', 'Новое', '', ''],
+    ])
+    gateway.reject_rows = {2}
+
+    async def scenario():
+        bad = service._stage(2, {'F': 'Решено'})
+        good = service._stage(3, {'F': 'В работе'})
+        await service.flush()
+        await good
+        with pytest.raises(APIError):
+            await bad
+
+    asyncio.run(scenario())
+    assert gateway.updates == [[{'range': 'F3', 'values': [['В работе']]}]]
+    assert service._pending == {}
+    assert service._flush_task is None
+    assert service._row_idx is None
+
+
+def test_transient_failure_gives_up_after_max_attempts(make_service, monkeypatch):
+    monkeypatch.setattr(appeals_service, '_WRITE_RETRY_DELAY', 0)
+    service, gateway = make_service([['c', 'p', 'f', '111', 'hist1', 'Новое', '', '']])
+    gateway.fail_updates = 10 ** 6
+
+    async def scenario():
+        assert await service.set_status_resolved(111) is False
+
+    asyncio.run(scenario())
+    assert gateway.fail_updates == 10 ** 6 - appeals_service._WRITE_MAX_ATTEMPTS
+    assert gateway.updates == []
+    assert service._pending == {}
+    assert service._attempts == {}
+    assert service._flush_task is None
+
+
+def test_status_setter_reports_permanent_failure(make_service):
+    service, gateway = make_service([['c', 'p', 'f', '111', 'hist1', 'Новое', '', '']])
+    gateway.reject_rows = {2}
+
+    async def scenario():
+        return await service.set_status_resolved(111), await service.create_appeal('c', 'p', 'f', 111, 'текст')
+
+    assert asyncio.run(scenario()) == (False, False)
+    assert gateway.updates == []
+
+
+# --- условное форматирование статусов ---
+
+def _text_eq_rule(status, start_col, end_col):
+    return {
+        'ranges': [{'startRowIndex': 1, 'startColumnIndex': start_col, 'endColumnIndex': end_col}],
+        'booleanRule': {'condition': {'type': 'TEXT_EQ', 'values': [{'userEnteredValue': status}]}},
+    }
+
+
+def test_conditional_formats_ignore_rules_on_other_columns(make_service):
+    service, gateway = make_service()
+    gateway.conditional_formats = [_text_eq_rule('Новое', 5, 6), _text_eq_rule('Решено', 6, 7)]
+
+    asyncio.run(service._setup_formats())
+
+    added = [r['booleanRule']['condition']['values'][0]['userEnteredValue'] for r in gateway.conditional_formats[2:]]
+    assert sorted(added) == sorted(set(appeals_service._STATUS_FILLS) - {'Новое'})
+    assert service._formats_ready
+
+    # Повторная настройка ничего не дублирует
+    service._formats_ready = False
+    asyncio.run(service._setup_formats())
+    assert len(gateway.conditional_formats) == 2 + len(added)
+
+
+def test_conditional_formats_retried_on_later_write(make_service, monkeypatch):
+    monkeypatch.setattr(appeals_service, '_FORMATS_RETRY_DELAY', 0)
+    service, gateway = make_service([['c', 'p', 'f', '111', 'hist1', 'Новое', '', '']])
+    gateway.fail_metadata = 1
+
+    async def scenario():
+        await service.initialize()
+        assert not service._formats_ready
+        assert await service.set_status_in_work(111)
+        # Повторная настройка идет в фоне и могла уже завершиться
+        if service._formats_task is not None:
+            await service._formats_task
+
+    asyncio.run(scenario())
+    assert service._formats_ready
+    assert len(gateway.conditional_formats) == len(appeals_service._STATUS_FILLS)
@@ -0,0 +1,87 @@
+"""
+Тесты индекса партнеров AuthService: собственные записи D:F не должны
+перестраивать индекс, а промах должен перечитывать колонки A/C.
+"""
+
+import asyncio
+import itertools
+
+import pytest
+
+import auth_service
+from auth_service import AuthService
+
+
+class FakeGateway:
+    """Колонки A/C листа авторизации и modifiedTime, который меняет каждая запись."""
+
+    def __init__(self, partners):
+        self.partners = list(partners)
+        self.revisions = itertools.count(1)
+        self.revision = next(self.revisions)
+        self.column_reads = 0
+        self.updates = []
+
+    async def get_last_update_time(self, worksheet):
+        return str(self.revision)
+
+    async def batch_get(self, worksheet, ranges, major_dimension=None):
+        self.column_reads += 1
+        return [[[code] for code, _ in self.partners], [[phone] for _, phone in self.partners]]
+
+    async def batch_update(self, worksheet, data):
+        self.updates.append(data)
+        self.revision = next(self.revisions)
+
+    def add_partner(self, code, phone):
+        self.partners.append((code, phone))
+        self.revision = next(self.revisions)
+
+
+@pytest.fixture
+def make_service(monkeypatch):
+    monkeypatch.setattr(auth_service, '_get_client_and_sheet', lambda: (None, object()))
+    monkeypatch.setattr(auth_service, '_AUTH_WRITE_BATCH_DELAY', 0)
+
+    def make(partners):
+        gateway = FakeGateway(partners)
+        return AuthService(gateway=gateway), gateway
+    return make
+
+
+def test_own_writes_do_not_rebuild_partner_index(make_service):
+    service, gateway = make_service([('P1', '79990000001'), ('P2', '79990000002')])
+
+    async def scenario():
+        assert await service.find_and_update_user('P1', '79990000001', 1)
+        assert await service.find_and_update_user('P2', '79990000002', 2)
+
+    asyncio.run(scenario())
+    assert gateway.column_reads == 1
+    assert [u[0]['range'] for u in gateway.updates] == ['D2:F2', 'D3:F3']
+
+
+def test_external_change_rebuilds_partner_index(make_service):
+    service, gateway = make_service([('P1', '79990000001')])
+
+    async def scenario():
+        assert await service.find_and_update_user('P1', '79990000001', 1)
+        gateway.add_partner('P2', '79990000002')
+        assert await service.find_and_update_user('P2', '79990000002', 2)
+
+    asyncio.run(scenario())
+    assert gateway.column_reads == 2
+
+
+def test_miss_rereads_columns_before_revision_catches_up(make_service, monkeypatch):
+    monkeypatch.setattr(auth_service, '_PARTNER_INDEX_MISS_REFRESH', 0)
+    service, gateway = make_service([('P1', '79990000001')])
+
+    async def scenario():
+        assert await service._find_partner_row('P1', '89990000001') == 2
+        # Строка уже в листе, а modifiedTime Drive еще прежний
+        gateway.partners.append(('P2', '79990000002'))
+        return await service._find_partner_row('P2', '89990000002')
+
+    assert asyncio.run(scenario()) == 3
+    assert gateway.column_reads == 2
@@ -1,10 +1,16 @@
 """
 Webhook handler для получения уведомлений от Google Sheets
 """
+import asyncio
 import logging
 import os
+import threading
+from typing import Optional
+
 from flask import Flask, request, jsonify
 from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
+from telegram.error import RetryAfter
+from telegram.request import HTTPXRequest
 from auth_service import AuthService
 import promotions_api  # Импортируем API акций
 
@@ -16,10 +22,37 @@ app = Flask(__name__, static_folder='.', static_url_path='')
 bot_token = os.getenv('TELEGRAM_TOKEN')
 admin_telegram_id = int(os.getenv('ADMIN_TELEGRAM_ID', '0'))
 web_app_url = os.getenv('WEB_APP_URL', '')
+webhook_secret = os.getenv('WEBHOOK_SECRET', 'default_secret')
+notify_concurrency = max(1, int(os.getenv('NOTIFY_CONCURRENCY', '10') or 10))
+# Темп рассылки (сообщений в секунду): Telegram допускает ~30 сообщений/с на бота
+notify_rate = max(1.0, float(os.getenv('NOTIFY_RATE', '25') or 25))
+notify_max_retries = 3
 
-bot = Bot(token=bot_token)
+# Пул соединений под параллельную рассылку (по умолчанию у HTTPXRequest — 1)
+bot = Bot(token=bot_token, request=HTTPXRequest(connection_pool_size=notify_concurrency))
 auth_service = AuthService()
 
+# Один фоновый event loop на процесс для рассылок: HTTP-пул Bot привязан
+# к loop'у, поэтому общий loop сохраняет keep-alive соединения с Telegram
+# между уведомлениями. Создаётся лениво (после fork воркера).
+_notify_loop: Optional[asyncio.AbstractEventLoop] = None
+_notify_loop_lock = threading.Lock()
+
+
+def _get_notify_loop() -> asyncio.AbstractEventLoop:
+    global _notify_loop
+    with _notify_loop_lock:
+        if _notify_loop is None or _notify_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='telegram-notify', daemon=True).start()
+            _notify_loop = loop
+    return _notify_loop
+
+
+def _run_in_background(coro) -> None:
+    """Планирует корутину в фоновом loop, не блокируя ответ webhook."""
+    asyncio.run_coroutine_threadsafe(coro, _get_notify_loop())
+
 
 
 @app.after_request
@@ -104,40 +137,17 @@ def handle_promotion_webhook():
         
         # Проверяем секретный ключ для безопасности
         secret_key = request.headers.get('X-Webhook-Secret')
-        expected_secret = os.getenv('WEBHOOK_SECRET', 'default_secret')
+        expected_secret = webhook_secret
         
         if secret_key != expected_secret:
             logger.warning(f"Неверный секретный ключ webhook: получен '{secret_key}', ожидается '{expected_secret}'")
             return jsonify({'error': 'Unauthorized'}), 401
         
         if action == 'publish':
-            # Запускаем асинхронную функцию в новом event loop
-            import asyncio
-            import threading
-            
-            def run_async(coro):
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    loop.run_until_complete(coro)
-                finally:
-                    loop.close()
-            
-            # Запускаем в отдельном потоке, чтобы не блокировать ответ webhook
-            threading.Thread(target=run_async, args=(send_promotion_notification(promotion_data),), daemon=True).start()
+            # Отправляем в фоновом loop, чтобы не блокировать ответ webhook
+            _run_in_background(send_promotion_notification(promotion_data))
         elif action == 'update':
-            import asyncio
-            import threading
-            
-            def run_async(coro):
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    loop.run_until_complete(coro)
-                finally:
-                    loop.close()
-            
-            threading.Thread(target=run_async, args=(send_promotion_update_notification(promotion_data),), daemon=True).start()
+            _run_in_background(send_promotion_update_notification(promotion_data))
         
         return jsonify({'status': 'success'})
         
@@ -180,7 +190,7 @@ async def send_promotion_notification(promotion_data):
         
         # Получаем всех авторизованных пользователей
         logger.info(f"👥 Получение списка авторизованных пользователей для отправки уведомления о акции '{title}'")
-        authorized_users = get_authorized_users()
+        authorized_users = await asyncio.to_thread(get_authorized_users)
         logger.info(f"👥 Найдено {len(authorized_users)} авторизованных пользователей для отправки уведомления")
         
         if not authorized_users:
@@ -201,21 +211,52 @@ async def send_promotion_notification(promotion_data):
                     logger.error(f"❌ Ошибка отправки уведомления админу: {e}")
             return
         
-        # Отправляем уведомления
-        sent_count = 0
-        failed_count = 0
-        for user_id in authorized_users:
-            try:
-                await bot.send_message(
-                    chat_id=user_id,
-                    text=message,
-                    reply_markup=keyboard
-                )
-                sent_count += 1
-                logger.info(f"✅ Уведомление о акции '{title}' (статус: {status}) отправлено пользователю {user_id}")
-            except Exception as e:
-                failed_count += 1
-                logger.error(f"❌ Ошибка отправки уведомления пользователю {user_id}: {e}")
+        # Отправляем уведомления параллельно (не больше notify_concurrency
+        # одновременных запросов) с общим темпом не выше notify_rate в секунду:
+        # лимит Telegram считается на весь бот, а не на отдельную отправку
+        semaphore = asyncio.Semaphore(notify_concurrency)
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / notify_rate
+        next_slot = loop.time()
+        
+        async def wait_slot():
+            nonlocal next_slot
+            now = loop.time()
+            slot = max(now, next_slot)
+            next_slot = slot + interval
+            if slot > now:
+                await asyncio.sleep(slot - now)
+        
+        async def send_one(user_id):
+            nonlocal next_slot
+            async with semaphore:
+                for attempt in range(notify_max_retries):
+                    await wait_slot()
+                    try:
+                        await bot.send_message(
+                            chat_id=user_id,
+                            text=message,
+                            reply_markup=keyboard
+                        )
+                        logger.info(f"✅ Уведомление о акции '{title}' (статус: {status}) отправлено пользователю {user_id}")
+                        return True
+                    except RetryAfter as e:
+                        # Flood control: Telegram просит подождать — сдвигаем
+                        # общий слот, чтобы притормозила вся рассылка
+                        next_slot = max(next_slot, loop.time() + e.retry_after)
+                        logger.warning(
+                            f"⏳ Лимит Telegram при отправке пользователю {user_id}, ожидание {e.retry_after} сек "
+                            f"(попытка {attempt + 1}/{notify_max_retries})"
+                        )
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка отправки уведомления пользователю {user_id}: {e}")
+                        return False
+                logger.error(f"❌ Уведомление пользователю {user_id} не отправлено: лимит Telegram после {notify_max_retries} попыток")
+                return False
+        
+        results = await asyncio.gather(*(send_one(user_id) for user_id in authorized_users))
+        sent_count = sum(results)
+        failed_count = len(results) - sent_count
         
         status = promotion_data.get('status', 'неизвестно')
         logger.info(f"📊 Итого: уведомление о акции '{title}' (статус: {status}) отправлено {sent_count} пользователям, ошибок: {failed_count}")